@@ -18,6 +18,9 @@ for path in (
     if path.is_dir() and str(path) not in sys.path:
         sys.path.insert(0, str(path))
 
+# Offline replay may run for a long time; lift the per-hook LLM time budget.
+os.environ.setdefault("AGENTIC_CONTEXT_LLM_BUDGET", "0")
+
 # Try repo-style import first; fall back to installed hooks path.
 try:
     from src.hooks.common import (  # type: ignore  # noqa: E402
@@ -1,16 +1,21 @@
 #!/usr/bin/env python3
+import asyncio
+import functools
+import itertools
 import json
 import os
 import re
 import sys
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional, Tuple, Dict, List
+from typing import Any, Optional, Tuple, Dict, List
 
 # Import path utilities
 try:
     from .utils.path_utils import get_project_dir, get_user_claude_dir, is_diagnostic_mode, save_diagnostic
     from .utils.tag_utils import normalize_tags, infer_tags_from_text
+    from .utils.json_utils import dumps as json_dumps, loads as json_loads
 except ImportError:
     # Fallback for direct execution or testing
     import sys
@@ -18,6 +23,7 @@ except ImportError:
     sys.path.insert(0, str(Path(__file__).parent))
     from utils.path_utils import get_project_dir, get_user_claude_dir, is_diagnostic_mode, save_diagnostic
     from utils.tag_utils import normalize_tags, infer_tags_from_text
+    from utils.json_utils import dumps as json_dumps, loads as json_loads
 
 try:
     import anthropic
@@ -39,6 +45,7 @@ except ImportError:
 # Import playbook engine utilities
 try:
     from .playbook_engine import (
+        MAX_KEYPOINTS,
         generate_keypoint_name,
         load_settings,
         validate_playbook_structure,
@@ -54,6 +61,7 @@ except ImportError:
     from pathlib import Path
     sys.path.insert(0, str(Path(__file__).parent))
     from playbook_engine import (
+        MAX_KEYPOINTS,
         generate_keypoint_name,
         load_settings,
         validate_playbook_structure,
@@ -89,11 +97,12 @@ except ImportError:
 def is_first_message(session_id: str) -> bool:
     session_file = get_project_dir() / ".claude" / "last_session.txt"
 
-    if session_file.exists():
+    try:
         last_session_id = session_file.read_text().strip()
-        return session_id != last_session_id
+    except FileNotFoundError:
+        return True
 
-    return True
+    return session_id != last_session_id
 
 
 def mark_session(session_id: str):
@@ -104,24 +113,53 @@ def mark_session(session_id: str):
 
 def clear_session():
     session_file = get_project_dir() / ".claude" / "last_session.txt"
-    if session_file.exists():
-        session_file.unlink()
+    session_file.unlink(missing_ok=True)
+
+
 
 
+# Word-ish tokens (letters, digits, underscores, hyphens) used for tag similarity.
+_TAG_TOKEN_RE = re.compile(r'[\w_-]+')
+
+
+@functools.lru_cache(maxsize=8192)
+def _lexical_tokens(text_lower: str) -> frozenset:
+    """Token set of a lowercased tag; tags recur across calls, so results are memoized."""
+    return frozenset(_TAG_TOKEN_RE.findall(text_lower))
 
 
 def calculate_lexical_similarity(text1: str, text2: str) -> float:
     """Calculate lexical similarity using Jaccard similarity with substring matching."""
+    return _lexical_similarity_parts(text1.lower(), None, text2.lower(), None)
+
+
+def calculate_lexical_similarity_batch(target: str, candidates: List[str]) -> List[float]:
+    """Score every candidate against ``target``, tokenizing ``target`` only once."""
+    target_lower = target.lower()
+    target_tokens = _lexical_tokens(target_lower)
+    return [
+        _lexical_similarity_parts(target_lower, target_tokens, candidate.lower(), None)
+        for candidate in candidates
+    ]
+
+
+def _lexical_similarity_parts(
+    text1_lower: str,
+    tokens1: Optional[frozenset],
+    text2_lower: str,
+    tokens2: Optional[frozenset],
+) -> float:
+    """calculate_lexical_similarity on lowercased texts.
+
+    Token sets may be precomputed by callers comparing against many texts;
+    pass None to tokenize lazily.
+    """
     # Handle empty strings
-    if not text1 and not text2:
+    if not text1_lower and not text2_lower:
         return 1.0
-    if not text1 or not text2:
+    if not text1_lower or not text2_lower:
         return 0.0
 
-    # Convert to lowercase
-    text1_lower = text1.lower()
-    text2_lower = text2.lower()
-
     # Check exact match
     if text1_lower == text2_lower:
         return 1.0
@@ -132,18 +170,20 @@ def calculate_lexical_similarity(text1: str, text2: str) -> float:
         substring_bonus = 0.7
 
     # Token-based similarity
-    tokens1 = set(re.findall(r'[\w_-]+', text1_lower))
-    tokens2 = set(re.findall(r'[\w_-]+', text2_lower))
+    if tokens1 is None:
+        tokens1 = _lexical_tokens(text1_lower)
+    if tokens2 is None:
+        tokens2 = _lexical_tokens(text2_lower)
 
     if not tokens1 and not tokens2:
         return 1.0
     if not tokens1 or not tokens2:
         return substring_bonus
 
-    intersection = tokens1 & tokens2
-    union = tokens1 | tokens2
+    intersection = len(tokens1 & tokens2)
+    union = len(tokens1) + len(tokens2) - intersection
 
-    jaccard_similarity = len(intersection) / len(union) if union else 0.0
+    jaccard_similarity = intersection / union if union else 0.0
 
     # Combine Jaccard similarity with substring bonus
     final_similarity = max(jaccard_similarity, substring_bonus)
@@ -151,19 +191,80 @@ def calculate_lexical_similarity(text1: str, text2: str) -> float:
     return final_similarity
 
 
+class _TagTokenCache:
+    """Lowercased form and token set of every tag in one ``existing_tags`` snapshot.
+
+    Also keeps token -> tag-position postings so tags sharing no token with the
+    target can be skipped when only a Jaccard score could reach the threshold.
+    """
+
+    def __init__(self, tags: List[str]):
+        self.tags = tuple(tags)
+        self.size = len(tags)
+        self.lowered = [tag.lower() for tag in tags]
+        self.tokens = [_lexical_tokens(lower) for lower in self.lowered]
+        self.postings: Dict[str, List[int]] = {}
+        self.tokenless: List[int] = []
+        for idx, tokens in enumerate(self.tokens):
+            if not tokens:
+                self.tokenless.append(idx)
+            for token in tokens:
+                self.postings.setdefault(token, []).append(idx)
+
+    def matches(self, tags: List[str]) -> bool:
+        # Compared by content, so lists edited in place never see stale scores.
+        return len(tags) == self.size and tuple(tags) == self.tags
+
+    def candidates(self, target_tokens: frozenset) -> List[int]:
+        """Positions of tags that share a token with the target (or, for a tokenless
+        target, that have no tokens either), in list order."""
+        if not target_tokens:
+            return self.tokenless
+        found = set()
+        for token in target_tokens:
+            found.update(self.postings.get(token, ()))
+        return sorted(found)
+
+
+_tag_token_cache: Optional[_TagTokenCache] = None
+
+
 def find_similar_tags(target_tag: str, existing_tags: List[str], threshold: float = 0.8) -> List[Tuple[str, float]]:
     """Find tags that are lexically similar to the target tag.
     Returns list of (tag, similarity_score) tuples above threshold."""
-    similar_tags = []
+    global _tag_token_cache
+
+    # Tag lowercasing/tokenizing is redone only when the tag contents change.
+    cache = _tag_token_cache
+    if cache is None or not cache.matches(existing_tags):
+        cache = _tag_token_cache = _TagTokenCache(existing_tags)
+
+    target_lower = target_tag.lower()
+    target_tokens = _lexical_tokens(target_lower)
 
-    for tag in existing_tags:
-        if tag.lower() == target_tag.lower():
+    # Above the 0.7 substring bonus only exact matches (which share all tokens)
+    # and Jaccard overlap can qualify, so tags with no shared token are skipped.
+    if threshold > 0.7:
+        positions = cache.candidates(target_tokens)
+    else:
+        positions = range(cache.size)
+
+    similar_tags = []
+    for idx in positions:
+        tag = existing_tags[idx]
+        tag_lower = cache.lowered[idx]
+        if tag_lower == target_lower:
             # Exact match gets highest score
             similar_tags.append((tag, 1.0))
             continue
 
         # Calculate lexical similarity
-        similarity = calculate_lexical_similarity(target_tag, tag)
+        similarity = _lexical_similarity_parts(
+            target_lower,
+            target_tokens,
+            tag_lower,
+            cache.tokens[idx],
+        )
         if similarity >= threshold:
             similar_tags.append((tag, similarity))
 
@@ -172,15 +273,147 @@ def find_similar_tags(target_tag: str, existing_tags: List[str], threshold: floa
     return similar_tags
 
 
-MAX_KEYPOINTS = 250  # hard cap to keep playbook manageable
+# id(key_points list) -> (key_points list, its length, playbook _rev, sorted tags, their JSON)
+_existing_tags_cache: Dict[int, Tuple[list, int, int, List[str], str]] = {}
 
 
-def get_anthropic_client() -> Tuple[Optional["anthropic.Anthropic"], Optional[str]]:
-    """Return (client, model). If diagnostics are on, log why a client is missing."""
+def collect_existing_tags(playbook: Optional[dict]) -> Tuple[List[str], str]:
+    """Return the sorted unique tags used across the playbook's key points,
+    together with their JSON encoding for embedding in prompts.
+
+    The result is cached per key_points list and recomputed when the list
+    is replaced, changes length, or the playbook's ``_rev`` counter (bumped by
+    update_playbook_data) moves. Callers must treat it as read-only.
+    """
+    if not playbook or "key_points" not in playbook:
+        return [], "[]"
+
+    key_points = playbook["key_points"]
+    rev = playbook.get("_rev", 0)
+    cached = _existing_tags_cache.get(id(key_points))
+    if (
+        cached is not None
+        and cached[0] is key_points
+        and cached[1] == len(key_points)
+        and cached[2] == rev
+    ):
+        return cached[3], cached[4]
+
+    tags_set = set()
+    for kp in key_points:
+        kp_tags = kp.get("tags", [])
+        if isinstance(kp_tags, list):
+            tags_set.update(kp_tags)
+    existing_tags = sorted(tags_set)
+    existing_tags_json = json_dumps(existing_tags)
+
+    _existing_tags_cache[id(key_points)] = (
+        key_points,
+        len(key_points),
+        rev,
+        existing_tags,
+        existing_tags_json,
+    )
+    return existing_tags, existing_tags_json
+
+
+# (id(messages), len(messages), limit) -> (messages list, serialized JSON)
+_serialized_messages_cache: Dict[Tuple[int, int, Optional[int]], Tuple[list, str]] = {}
+
+
+def serialize_messages(messages: Optional[list], limit: Optional[int] = None) -> str:
+    """Serialize the last ``limit`` messages (all when None) as compact JSON for a prompt.
+
+    Several LLM calls in one hook run share the same conversation window, so the
+    result is cached per messages list and reused while its length is unchanged.
+    """
+    if not messages:
+        return "[]"
+
+    key = (id(messages), len(messages), limit)
+    cached = _serialized_messages_cache.get(key)
+    if cached is not None and cached[0] is messages:
+        return cached[1]
+
+    window = messages[-limit:] if limit else messages
+    serialized = json_dumps(window)
+    _serialized_messages_cache[key] = (messages, serialized)
+    return serialized
+
+
+# Below this many characters of conversation there is nothing worth reflecting on
+# unless the playbook has existing key points that still need evaluating.
+MIN_REFLECTION_CHARS = 200
+
+
+# A ```json block wherever it appears wins; otherwise the first fenced block of any kind.
+_JSON_FENCE_RE = re.compile(r"```json\s*(.*?)```", re.DOTALL)
+_ANY_FENCE_RE = re.compile(r"```\s*(.*?)```", re.DOTALL)
+
+
+def extract_json_payload(response_text: str) -> str:
+    """Return the fenced JSON payload of an LLM response, or the whole text if unfenced."""
+    match = _JSON_FENCE_RE.search(response_text) or _ANY_FENCE_RE.search(response_text)
+    return match.group(1).strip() if match else response_text.strip()
+
+
+def parse_json_payload(response_text: str) -> Any:
+    """Extract and decode the JSON payload of an LLM response.
+
+    Raises json.JSONDecodeError when there is no parseable payload. Prose-only
+    replies (no ``{`` or ``[``) are rejected without attempting a decode.
+    """
+    json_text = extract_json_payload(response_text)
+    if "{" not in json_text and "[" not in json_text:
+        raise json.JSONDecodeError("Expecting JSON object or array", json_text, 0)
+    return json_loads(json_text)
+
+
+# Claude Code kills a hook after its "timeout" in settings.json (120 s). All LLM
+# calls of one process share a wall-clock budget of three quarters of that,
+# counted from import, so the fallback path still runs before the hook is
+# killed. AGENTIC_CONTEXT_LLM_BUDGET overrides it; 0 disables it for offline
+# tools such as the bootstrap script.
+HOOK_TIMEOUT_SECONDS = 120
+try:
+    LLM_BUDGET_SECONDS = float(
+        os.getenv("AGENTIC_CONTEXT_LLM_BUDGET") or HOOK_TIMEOUT_SECONDS * 0.75
+    )
+except ValueError:
+    LLM_BUDGET_SECONDS = HOOK_TIMEOUT_SECONDS * 0.75
+_llm_deadline = time.monotonic() + LLM_BUDGET_SECONDS if LLM_BUDGET_SECONDS > 0 else None
+
+# httpx's timeout bounds each connect/read, not a whole streamed call, so it is
+# only the per-attempt cap; the SDK retries transient failures LLM_MAX_RETRIES
+# times with backoff. The SDK default of 10 minutes would outlive the hook.
+LLM_MAX_RETRIES = 2
+try:
+    LLM_TIMEOUT_SECONDS = float(os.getenv("AGENTIC_CONTEXT_TIMEOUT") or 30)
+except ValueError:
+    LLM_TIMEOUT_SECONDS = 30.0
+
+
+def _llm_call_limits() -> Tuple[Optional[float], float]:
+    """Return (seconds left in the LLM budget or None, per-attempt timeout).
+
+    Raises TimeoutError when the budget is already spent. The per-attempt
+    timeout leaves a share of what is left for the gap after the last chunk
+    check, so connect, retries and streaming together stay inside the budget.
+    """
+    if _llm_deadline is None:
+        return None, LLM_TIMEOUT_SECONDS
+    left = _llm_deadline - time.monotonic()
+    if left <= 0:
+        raise TimeoutError("LLM time budget for this hook run is spent")
+    return left, min(LLM_TIMEOUT_SECONDS, left / (LLM_MAX_RETRIES + 2))
+
+
+def _anthropic_client_config() -> Optional[Tuple[str, Optional[str], str]]:
+    """Return (api_key, base_url, model). If diagnostics are on, log why a client is missing."""
     if not ANTHROPIC_AVAILABLE:
         if is_diagnostic_mode():
             save_diagnostic("anthropic not installed", "client_missing")
-        return None, None
+        return None
 
     model = (
         os.getenv("AGENTIC_CONTEXT_MODEL")
@@ -191,7 +424,7 @@ def get_anthropic_client() -> Tuple[Optional["anthropic.Anthropic"], Optional[st
     if not model:
         if is_diagnostic_mode():
             save_diagnostic("model not configured", "client_missing")
-        return None, None
+        return None
 
     api_key = (
         os.getenv("AGENTIC_CONTEXT_API_KEY")
@@ -201,15 +434,205 @@ def get_anthropic_client() -> Tuple[Optional["anthropic.Anthropic"], Optional[st
     if not api_key:
         if is_diagnostic_mode():
             save_diagnostic("api key not configured", "client_missing")
-        return None, None
+        return None
 
     base_url = os.getenv("AGENTIC_CONTEXT_BASE_URL") or os.getenv("ANTHROPIC_BASE_URL")
+    return api_key, base_url, model
 
-    client = (
-        anthropic.Anthropic(api_key=api_key, base_url=base_url)
-        if base_url
-        else anthropic.Anthropic(api_key=api_key)
-    )
+
+class _FenceTracker:
+    """Accumulates streamed text and notices when a ```json block has closed.
+
+    extract_json_payload() prefers the first ```json block, so once its closing
+    ``` has arrived the rest of the response cannot change the result. Other
+    fences are not counted: a ```json block may still follow them, and a reply
+    without one is read to the end for the any-fence fallback.
+    """
+
+    def __init__(self):
+        self._text = ""
+        self._scan_from = 0
+        self._json_open = False
+
+    def feed(self, chunk: str) -> bool:
+        """Add a chunk; return True once the first ```json block is complete."""
+        self._text += chunk
+        if not self._json_open:
+            idx = self._text.find("```json", self._scan_from)
+            if idx == -1:
+                # The opener may still be split across this chunk and the next one.
+                self._scan_from = max(self._scan_from, len(self._text) - 6)
+                return False
+            self._json_open = True
+            self._scan_from = idx + 7
+
+        idx = self._text.find("```", self._scan_from)
+        if idx == -1:
+            self._scan_from = max(self._scan_from, len(self._text) - 2)
+            return False
+        return True
+
+    def text(self) -> str:
+        return self._text
+
+
+def _stream_response_text_sync(client, model: str, prompt: str, max_tokens: int) -> str:
+    """Stream a completion, stopping as soon as its fenced JSON block has closed.
+
+    Raises TimeoutError once the shared LLM budget runs out, even while a slow
+    response is still trickling in.
+    """
+    left, attempt_timeout = _llm_call_limits()
+    deadline = time.monotonic() + left if left is not None else None
+    tracker = _FenceTracker()
+    with client.messages.stream(
+        model=model,
+        max_tokens=max_tokens,
+        messages=[{"role": "user", "content": prompt}],
+        timeout=attempt_timeout,
+    ) as stream:
+        for chunk in stream.text_stream:
+            if tracker.feed(chunk):
+                break
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("LLM time budget ran out mid-stream")
+    return tracker.text()
+
+
+async def _stream_response_text(client, model: str, prompt: str, max_tokens: int) -> str:
+    """Async variant of _stream_response_text_sync for the AsyncAnthropic client."""
+    left, attempt_timeout = _llm_call_limits()
+
+    async def _stream() -> str:
+        tracker = _FenceTracker()
+        async with client.messages.stream(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}],
+            timeout=attempt_timeout,
+        ) as stream:
+            async for chunk in stream.text_stream:
+                if tracker.feed(chunk):
+                    break
+        return tracker.text()
+
+    return await asyncio.wait_for(_stream(), timeout=left)
+
+
+def _render_prompt(
+    template_name: str,
+    format_params: dict,
+    prompt_suffix: str = "",
+    replace_placeholders: bool = False,
+) -> str:
+    template = load_template(template_name)
+    if replace_placeholders:
+        # For templates with literal JSON braces that str.format would trip over
+        for key, value in format_params.items():
+            template = template.replace("{" + key + "}", str(value))
+        return template + prompt_suffix
+    return template.format(**format_params) + prompt_suffix
+
+
+def _decode_llm_response(prompt: str, response_text: str, diagnostic_name: str) -> Any:
+    """Log the exchange in diagnostic mode and return its JSON payload (None if unusable)."""
+    if is_diagnostic_mode():
+        save_diagnostic(
+            f"# PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
+            diagnostic_name,
+        )
+
+    if not response_text:
+        return None
+    try:
+        return parse_json_payload(response_text)
+    except json.JSONDecodeError:
+        return None
+
+
+def _call_json_llm(
+    client,
+    model: str,
+    template_name: str,
+    format_params: dict,
+    max_tokens: int,
+    diagnostic_name: str,
+    prompt_suffix: str = "",
+    replace_placeholders: bool = False,
+) -> Any:
+    """Render a prompt template, run it on the sync client and decode the JSON reply.
+
+    Returns the parsed payload, or None for an empty or non-JSON response.
+    replace_placeholders substitutes ``{key}`` literally instead of str.format.
+    """
+    prompt = _render_prompt(template_name, format_params, prompt_suffix, replace_placeholders)
+    try:
+        response_text = _stream_response_text_sync(client, model, prompt, max_tokens)
+    except (
+        anthropic.APITimeoutError,
+        anthropic.APIConnectionError,
+        asyncio.TimeoutError,
+        TimeoutError,
+    ) as exc:
+        # Retries or the time budget are exhausted; fall back rather than fail the hook.
+        response_text = ""
+        if is_diagnostic_mode():
+            save_diagnostic(f"LLM call gave up: {exc!r}", diagnostic_name)
+    return _decode_llm_response(prompt, response_text, diagnostic_name)
+
+
+async def _call_json_llm_async(
+    client,
+    model: str,
+    template_name: str,
+    format_params: dict,
+    max_tokens: int,
+    diagnostic_name: str,
+    prompt_suffix: str = "",
+) -> Any:
+    """Async variant of _call_json_llm for the AsyncAnthropic client."""
+    prompt = _render_prompt(template_name, format_params, prompt_suffix)
+    try:
+        response_text = await _stream_response_text(client, model, prompt, max_tokens)
+    except (
+        anthropic.APITimeoutError,
+        anthropic.APIConnectionError,
+        asyncio.TimeoutError,
+        TimeoutError,
+    ) as exc:
+        # Retries or the time budget are exhausted; fall back rather than fail the hook.
+        response_text = ""
+        if is_diagnostic_mode():
+            save_diagnostic(f"LLM call gave up: {exc!r}", diagnostic_name)
+    return _decode_llm_response(prompt, response_text, diagnostic_name)
+
+
+def _client_kwargs(api_key: str, base_url: Optional[str]) -> dict:
+    kwargs = {"api_key": api_key, "timeout": LLM_TIMEOUT_SECONDS, "max_retries": LLM_MAX_RETRIES}
+    if base_url:
+        kwargs["base_url"] = base_url
+    return kwargs
+
+
+def get_anthropic_client() -> Tuple[Optional["anthropic.Anthropic"], Optional[str]]:
+    """Return (client, model). If diagnostics are on, log why a client is missing."""
+    config = _anthropic_client_config()
+    if config is None:
+        return None, None
+    api_key, base_url, model = config
+
+    client = anthropic.Anthropic(**_client_kwargs(api_key, base_url))
+    return client, model
+
+
+def get_async_anthropic_client() -> Tuple[Optional["anthropic.AsyncAnthropic"], Optional[str]]:
+    """Async counterpart of get_anthropic_client() for coroutine-based callers."""
+    config = _anthropic_client_config()
+    if config is None:
+        return None, None
+    api_key, base_url, model = config
+
+    client = anthropic.AsyncAnthropic(**_client_kwargs(api_key, base_url))
     return client, model
 
 
@@ -232,16 +655,12 @@ def generate_tags_from_messages(
     """
     prompt_seed_tags = normalize_tags(infer_tags_from_text(prompt_text, max_tags=4))
 
+    # Nothing to tag beyond the seeds: skip the network round trip.
+    if not prompt_text and len(messages or []) < 2:
+        return prompt_seed_tags, prompt_seed_tags
+
     # Get existing tags from playbook key_points
-    existing_tags = []
-    if playbook and "key_points" in playbook:
-        # Collect all unique tags from key_points
-        tags_set = set()
-        for kp in playbook["key_points"]:
-            kp_tags = kp.get("tags", [])
-            if isinstance(kp_tags, list):
-                tags_set.update(kp_tags)
-        existing_tags = list(tags_set)
+    existing_tags, existing_tags_json = collect_existing_tags(playbook)
 
     client, model = get_anthropic_client()
     if not client:
@@ -249,56 +668,25 @@ def generate_tags_from_messages(
             save_diagnostic("no client available for tagger", diagnostic_name)
         return prompt_seed_tags, prompt_seed_tags
 
-    recent_messages = messages[-12:] if messages else []
-    template = load_template("tagger.txt")
-
-    prompt = template.format(
-        conversation=json.dumps(recent_messages, indent=2, ensure_ascii=False),
-        prompt=prompt_text,
-        existing_tags_context="",  # Empty placeholder since we removed it from template
+    # Provide simple tag list to help LLM understand the tag space
+    existing_tags_context = (
+        f"\n\nExisting tags in playbook: {existing_tags_json}" if existing_tags else ""
     )
 
-    # Add existing tags context if we have any
-    if existing_tags:
-        # Provide simple tag list to help LLM understand the tag space
-        existing_tags_context = f"\n\nExisting tags in playbook: {json.dumps(sorted(existing_tags))}"
-        prompt += existing_tags_context
-
-    response = client.messages.create(
-        model=model, max_tokens=1024, messages=[{"role": "user", "content": prompt}]
+    parsed = _call_json_llm(
+        client,
+        model,
+        "tagger.txt",
+        {
+            "conversation": serialize_messages(messages, limit=12),
+            "prompt": prompt_text,
+            "existing_tags_context": "",  # Empty placeholder since we removed it from template
+        },
+        max_tokens=1024,
+        diagnostic_name=diagnostic_name,
+        prompt_suffix=existing_tags_context,
     )
-
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
-
-    response_text = "".join(response_text_parts)
-
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
-        )
-
-    if not response_text:
-        return prompt_seed_tags, prompt_seed_tags
-
-    if "```json" in response_text:
-        start = response_text.find("```json") + 7
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip()
-    elif "```" in response_text:
-        start = response_text.find("```") + 3
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip()
-    else:
-        json_text = response_text.strip()
-
-    try:
-        parsed = json.loads(json_text)
-    except json.JSONDecodeError:
+    if parsed is None:
         return prompt_seed_tags, prompt_seed_tags
 
     llm_tags: list[str] = []
@@ -307,8 +695,8 @@ def generate_tags_from_messages(
     elif isinstance(parsed, dict) and "tags" in parsed:
         llm_tags = [t for t in parsed.get("tags", []) if isinstance(t, str)]
 
-    # 合并LLM生成的标签和种子标签，去重
-    combined_tags = list(set(llm_tags + prompt_seed_tags))
+    # 合并LLM生成的标签和种子标签，按顺序去重（种子标签优先），最多6个
+    combined_tags = list(dict.fromkeys(itertools.chain(prompt_seed_tags, llm_tags)))[:6]
     return combined_tags, prompt_seed_tags
 
 
@@ -332,15 +720,7 @@ def generate_task_guidance(
     prompt_seed_tags = normalize_tags(infer_tags_from_text(prompt_text, max_tags=4))
 
     # Get existing tags from playbook key_points
-    existing_tags = []
-    if playbook and "key_points" in playbook:
-        # Collect all unique tags from key_points
-        tags_set = set()
-        for kp in playbook["key_points"]:
-            kp_tags = kp.get("tags", [])
-            if isinstance(kp_tags, list):
-                tags_set.update(kp_tags)
-        existing_tags = list(tags_set)
+    existing_tags, existing_tags_json = collect_existing_tags(playbook)
 
     client, model = get_anthropic_client()
     if not client:
@@ -359,111 +739,75 @@ def generate_task_guidance(
         }
 
     # Add existing tags context if we have any
-    recent_messages = messages[-12:] if messages else []
     format_params = {
-        "conversation": json.dumps(recent_messages, indent=2, ensure_ascii=False),
+        "conversation": serialize_messages(messages, limit=12),
         "prompt": prompt_text,
     }
 
     if existing_tags:
         # Provide simple tag list to help LLM understand tag space
-        existing_tags_context = f"Available tags: {json.dumps(sorted(existing_tags))}"
+        existing_tags_context = f"Available tags: {existing_tags_json}"
         format_params["existing_tags_context"] = existing_tags_context
     else:
         # No existing tags available
         format_params["existing_tags_context"] = "No existing tags available."
 
-    template = load_template("task_guidance.txt")
-    prompt = template.format(**format_params)
-
-    response = client.messages.create(
-        model=model, max_tokens=2048, messages=[{"role": "user", "content": prompt}]
+    parsed = _call_json_llm(
+        client,
+        model,
+        "task_guidance.txt",
+        format_params,
+        max_tokens=2048,
+        diagnostic_name=diagnostic_name,
     )
 
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
-
-    response_text = "".join(response_text_parts)
-
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
-        )
-
-    if not response_text:
-        # Fallback to seed tags
+    if parsed is None:
+        # Empty or unparseable response: fall back to seed tags
         llm_tags = prompt_seed_tags
         guidance_result = {
             "complexity": "moderate",
+            "show_guidance": False,
             "brief_guidance": ""
         }
     else:
-        # Parse JSON response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            json_text = response_text[start:end].strip()
-        elif "```" in response_text:
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            json_text = response_text[start:end].strip()
+        # Extract tags
+        tags_data = parsed.get("tags", {})
+        if isinstance(tags_data, dict) and "final_tags" in tags_data:
+            llm_tags = [t for t in tags_data.get("final_tags", []) if isinstance(t, str)]
         else:
-            json_text = response_text.strip()
-
-        try:
-            parsed = json.loads(json_text)
-
-            # Extract tags
-            tags_data = parsed.get("tags", {})
-            if isinstance(tags_data, dict) and "final_tags" in tags_data:
-                llm_tags = [t for t in tags_data.get("final_tags", []) if isinstance(t, str)]
-            else:
-                llm_tags = [t for t in tags_data if isinstance(t, str)]
-
-            # Extract guidance
-            guidance_result = parsed.get("task_guidance", {})
-
-            # Handle both old and new formats
-            # If old format detected, convert to new minimal format
-            if "needs_clarification" in guidance_result or "clarification_questions" in guidance_result:
-                # Old format detected - convert to new format
-                complexity = guidance_result.get("complexity", "moderate")
-                needs_clarification = guidance_result.get("needs_clarification", False)
-                assessment = guidance_result.get("assessment", "")
-
-                # Generate brief guidance from old format
-                brief_guidance = ""
-
-                if needs_clarification and "clarification_questions" in guidance_result:
-                    questions = guidance_result.get("clarification_questions", [])
-                    if questions:
-                        brief_guidance = f"Clarify the following: {questions[0] if len(questions) > 0 else 'What are the specific requirements?'}"
-                elif "suggested_approach" in guidance_result:
-                    brief_guidance = guidance_result.get("suggested_approach", "")[:100] + "." if len(guidance_result.get("suggested_approach", "")) > 0 else ""
-
-                # Create new format
-                new_guidance_result = {
-                    "complexity": complexity,
-                    "brief_guidance": brief_guidance
-                }
-                guidance_result = new_guidance_result
-            else:
-                # New format detected - ensure required fields exist
-                if "brief_guidance" not in guidance_result:
-                    guidance_result["brief_guidance"] = ""
-
-        except json.JSONDecodeError:
-            # Fallback to seed tags
-            llm_tags = prompt_seed_tags
-            guidance_result = {
-                "complexity": "moderate",
-                "show_guidance": False,
-                "brief_guidance": ""
+            llm_tags = [t for t in tags_data if isinstance(t, str)]
+
+        # Extract guidance
+        guidance_result = parsed.get("task_guidance", {})
+
+        # Handle both old and new formats
+        # If old format detected, convert to new minimal format
+        if "needs_clarification" in guidance_result or "clarification_questions" in guidance_result:
+            # Old format detected - convert to new format
+            complexity = guidance_result.get("complexity", "moderate")
+            needs_clarification = guidance_result.get("needs_clarification", False)
+            assessment = guidance_result.get("assessment", "")
+
+            # Generate brief guidance from old format
+            brief_guidance = ""
+
+            if needs_clarification and "clarification_questions" in guidance_result:
+                questions = guidance_result.get("clarification_questions", [])
+                if questions:
+                    brief_guidance = f"Clarify the following: {questions[0] if len(questions) > 0 else 'What are the specific requirements?'}"
+            elif "suggested_approach" in guidance_result:
+                brief_guidance = guidance_result.get("suggested_approach", "")[:100] + "." if len(guidance_result.get("suggested_approach", "")) > 0 else ""
+
+            # Create new format
+            new_guidance_result = {
+                "complexity": complexity,
+                "brief_guidance": brief_guidance
             }
+            guidance_result = new_guidance_result
+        else:
+            # New format detected - ensure required fields exist
+            if "brief_guidance" not in guidance_result:
+                guidance_result["brief_guidance"] = ""
 
     # Combine and normalize tags
     combined = normalize_tags(prompt_seed_tags + llm_tags, max_tags=6)
@@ -499,15 +843,7 @@ def generate_tags_and_workflow(
     prompt_seed_tags = normalize_tags(infer_tags_from_text(prompt_text, max_tags=4))
 
     # Get existing tags from playbook key_points
-    existing_tags = []
-    if playbook and "key_points" in playbook:
-        # Collect all unique tags from key_points
-        tags_set = set()
-        for kp in playbook["key_points"]:
-            kp_tags = kp.get("tags", [])
-            if isinstance(kp_tags, list):
-                tags_set.update(kp_tags)
-        existing_tags = list(tags_set)
+    existing_tags, existing_tags_json = collect_existing_tags(playbook)
 
     client, model = get_anthropic_client()
     if not client:
@@ -530,40 +866,26 @@ def generate_tags_and_workflow(
             }
         }
 
-    recent_messages = messages[-12:] if messages else []
-    template = load_template("tagger_with_workflow.txt")
-
-    prompt = template.format(
-        conversation=json.dumps(recent_messages, indent=2, ensure_ascii=False),
-        prompt=prompt_text,
+    # Provide simple tag list to help LLM understand tag space
+    existing_tags_context = (
+        f"\n\nExisting tags in playbook: {existing_tags_json}" if existing_tags else ""
     )
 
-    # Add existing tags context if we have any
-    if existing_tags:
-        # Provide simple tag list to help LLM understand tag space
-        existing_tags_context = f"\n\nExisting tags in playbook: {json.dumps(sorted(existing_tags))}"
-        prompt += existing_tags_context
-
-    response = client.messages.create(
-        model=model, max_tokens=2048, messages=[{"role": "user", "content": prompt}]
+    parsed = _call_json_llm(
+        client,
+        model,
+        "tagger_with_workflow.txt",
+        {
+            "conversation": serialize_messages(messages, limit=12),
+            "prompt": prompt_text,
+        },
+        max_tokens=2048,
+        diagnostic_name=diagnostic_name,
+        prompt_suffix=existing_tags_context,
     )
 
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
-
-    response_text = "".join(response_text_parts)
-
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
-        )
-
-    if not response_text:
-        # Fallback to seed tags
+    if parsed is None:
+        # Empty or unparseable response: fall back to seed tags
         llm_tags = prompt_seed_tags
         workflow_result = {
             "complexity": "moderate",
@@ -576,52 +898,23 @@ def generate_tags_and_workflow(
             "analysis_depth": 1
         }
     else:
-        # Parse JSON response
-        if "```json" in response_text:
-            start = response_text.find("```json") + 7
-            end = response_text.find("```", start)
-            json_text = response_text[start:end].strip()
-        elif "```" in response_text:
-            start = response_text.find("```") + 3
-            end = response_text.find("```", start)
-            json_text = response_text[start:end].strip()
+        # Extract tags
+        tags_data = parsed.get("tags", {})
+        if isinstance(tags_data, dict) and "final_tags" in tags_data:
+            llm_tags = [t for t in tags_data.get("final_tags", []) if isinstance(t, str)]
         else:
-            json_text = response_text.strip()
+            llm_tags = [t for t in tags_data if isinstance(t, str)]
 
-        try:
-            parsed = json.loads(json_text)
-
-            # Extract tags
-            tags_data = parsed.get("tags", {})
-            if isinstance(tags_data, dict) and "final_tags" in tags_data:
-                llm_tags = [t for t in tags_data.get("final_tags", []) if isinstance(t, str)]
-            else:
-                llm_tags = [t for t in tags_data if isinstance(t, str)]
-
-            # Extract workflow evaluation
-            workflow_result = parsed.get("workflow", {})
-
-            # Ensure required fields exist
-            if "suggested_action" not in workflow_result:
-                workflow_result["suggested_action"] = "proceed"
-            if "clarification_questions" not in workflow_result:
-                workflow_result["clarification_questions"] = []
-            if "analysis_depth" not in workflow_result:
-                workflow_result["analysis_depth"] = 1
-
-        except json.JSONDecodeError:
-            # Fallback to seed tags
-            llm_tags = prompt_seed_tags
-            workflow_result = {
-                "complexity": "moderate",
-                "confidence": 0.5,
-                "reasoning": "JSON decode error",
-                "needs_clarification": False,
-                "needs_deep_analysis": False,
-                "suggested_action": "proceed",
-                "clarification_questions": [],
-                "analysis_depth": 1
-            }
+        # Extract workflow evaluation
+        workflow_result = parsed.get("workflow", {})
+
+        # Ensure required fields exist
+        if "suggested_action" not in workflow_result:
+            workflow_result["suggested_action"] = "proceed"
+        if "clarification_questions" not in workflow_result:
+            workflow_result["clarification_questions"] = []
+        if "analysis_depth" not in workflow_result:
+            workflow_result["analysis_depth"] = 1
 
     # Combine and normalize tags
     combined = normalize_tags(prompt_seed_tags + llm_tags, max_tags=6)
@@ -637,90 +930,203 @@ def generate_tags_and_workflow(
     }
 
 
+def _reflection_format_params(messages: list[dict], playbook: dict) -> dict:
+    """Template parameters for reflection.txt."""
+    # Split active and pending key points in a single pass.
+    existing_playbook = {}
+    pending_playbook = {}
+    for kp in playbook["key_points"]:
+        target = pending_playbook if kp.get("pending") else existing_playbook
+        target[kp["name"]] = kp["text"]
+
+    # Collect existing tags from all key_points
+    _, existing_tags_json = collect_existing_tags(playbook)
+
+    return {
+        "trajectories": serialize_messages(messages),
+        "existing_playbook": json_dumps(existing_playbook, indent=True),
+        "pending_playbook": json_dumps(pending_playbook, indent=True),
+        "existing_tags_context": f"\n\nExisting tags in playbook: {existing_tags_json}",
+    }
+
+
+def _reflection_too_small(messages: list[dict], playbook: dict, diagnostic_name: str) -> bool:
+    """An empty playbook plus a near-empty conversation cannot yield key points."""
+    if playbook["key_points"]:
+        return False
+    total_text = sum(len(m.get("content") or "") for m in messages)
+    if total_text >= MIN_REFLECTION_CHARS:
+        return False
+    if is_diagnostic_mode():
+        save_diagnostic(
+            f"skipped reflection: {total_text} chars and empty playbook",
+            diagnostic_name,
+        )
+    return True
+
+
+def _shape_reflection_result(result: Any) -> dict:
+    if not isinstance(result, dict):
+        return {"new_key_points": [], "evaluations": []}
+    return {
+        "merged_key_points": result.get("merged_key_points"),
+        "new_key_points": result.get("new_key_points", []),
+        "evaluations": result.get("evaluations", []),
+    }
+
+
 async def extract_keypoints(
     messages: list[dict], playbook: dict, diagnostic_name: str = "reflection"
 ) -> dict:
-    client, model = get_anthropic_client()
+    if _reflection_too_small(messages, playbook, diagnostic_name):
+        return {"new_key_points": [], "evaluations": []}
+
+    client, model = get_async_anthropic_client()
     if not client:
         if is_diagnostic_mode():
             save_diagnostic("no client available for reflection", diagnostic_name)
         return {"new_key_points": [], "evaluations": []}
 
-    template = load_template("reflection.txt")
-
-    existing_playbook = (
-        {kp["name"]: kp["text"] for kp in playbook["key_points"] if not kp.get("pending")}
-        if playbook["key_points"]
-        else {}
-    )
-    pending_playbook = (
-        {kp["name"]: kp["text"] for kp in playbook["key_points"] if kp.get("pending")}
-        if playbook["key_points"]
-        else {}
+    result = await _call_json_llm_async(
+        client,
+        model,
+        "reflection.txt",
+        _reflection_format_params(messages, playbook),
+        max_tokens=4096,
+        diagnostic_name=diagnostic_name,
     )
+    return _shape_reflection_result(result)
 
-    # Collect existing tags from all key_points
-    existing_tags = []
-    if playbook and "key_points" in playbook:
-        tags_set = set()
-        for kp in playbook["key_points"]:
-            kp_tags = kp.get("tags", [])
-            if isinstance(kp_tags, list):
-                tags_set.update(kp_tags)
-        existing_tags = list(tags_set)
-
-    existing_tags_context = f"\n\nExisting tags in playbook: {json.dumps(sorted(existing_tags))}"
-
-    prompt = template.format(
-        trajectories=json.dumps(messages, indent=2, ensure_ascii=False),
-        existing_playbook=json.dumps(
-            existing_playbook, indent=2, ensure_ascii=False
-        ),
-        pending_playbook=json.dumps(
-            pending_playbook, indent=2, ensure_ascii=False
-        ),
-        existing_tags_context=existing_tags_context,
-    )
 
-    response = client.messages.create(
-        model=model, max_tokens=4096, messages=[{"role": "user", "content": prompt}]
-    )
+BATCH_POLL_INTERVAL = 10  # seconds between Message Batch status checks
+BATCH_MAX_WAIT = 30 * 60  # give up on (and cancel) a batch after this many seconds
 
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
 
-    response_text = "".join(response_text_parts)
+async def extract_keypoints_batch(
+    message_sets: list[list[dict]],
+    playbook: dict,
+    diagnostic_name: str = "reflection_batch",
+) -> list[dict]:
+    """Run extract_keypoints() over several independent inputs as one Message Batch.
 
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
+    Batches are billed at a discount but finish asynchronously (usually within
+    minutes), so this is meant for offline callers such as the bootstrap
+    script, not interactive hooks. Falls back to concurrent single calls when
+    there is only one input or the endpoint rejects batches; entries that do
+    not come back ``succeeded`` are retried as single calls. A batch still
+    running after BATCH_MAX_WAIT seconds is cancelled and yields empty results.
+
+    Returns:
+        One extract_keypoints()-shaped dict per entry of ``message_sets``, in order.
+    """
+    results = [{"new_key_points": [], "evaluations": []} for _ in message_sets]
+    pending = [
+        i
+        for i, messages in enumerate(message_sets)
+        if not _reflection_too_small(messages, playbook, diagnostic_name)
+    ]
+    if not pending:
+        return results
+
+    client, model = get_async_anthropic_client()
+    if not client:
+        if is_diagnostic_mode():
+            save_diagnostic("no client available for reflection batch", diagnostic_name)
+        return results
+
+    async def _individually(indices: list[int]) -> list[dict]:
+        singles = await asyncio.gather(
+            *(
+                extract_keypoints(message_sets[i], playbook, f"{diagnostic_name}_{i}")
+                for i in indices
+            )
         )
+        for i, single in zip(indices, singles):
+            results[i] = single
+        return results
 
-    if not response_text:
-        return {"new_key_points": [], "evaluations": []}
+    if len(pending) == 1:
+        return await _individually(pending)
 
-    if "```json" in response_text:
-        start = response_text.find("```json") + 7
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip()
-    elif "```" in response_text:
-        start = response_text.find("```") + 3
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip()
-    else:
-        json_text = response_text.strip()
+    template = load_template("reflection.txt")
+    prompts = {
+        str(i): template.format(**_reflection_format_params(message_sets[i], playbook))
+        for i in pending
+    }
 
     try:
-        result = json.loads(json_text)
-    except json.JSONDecodeError:
-        return {"new_key_points": [], "evaluations": []}
+        batch = await client.messages.batches.create(
+            requests=[
+                {
+                    "custom_id": custom_id,
+                    "params": {
+                        "model": model,
+                        "max_tokens": 4096,
+                        "messages": [{"role": "user", "content": prompt}],
+                    },
+                }
+                for custom_id, prompt in prompts.items()
+            ]
+        )
+    except Exception as exc:
+        # Proxies and older SDKs may not expose the batch endpoint.
+        if is_diagnostic_mode():
+            save_diagnostic(f"batch request failed, calling individually: {exc}", diagnostic_name)
+        return await _individually(pending)
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + BATCH_MAX_WAIT
+    while batch.processing_status != "ended":
+        if loop.time() >= deadline:
+            if is_diagnostic_mode():
+                save_diagnostic(
+                    f"batch {batch.id} still running after {BATCH_MAX_WAIT}s, cancelling",
+                    diagnostic_name,
+                )
+            try:
+                await client.messages.batches.cancel(batch.id)
+            except Exception:
+                pass
+            return results
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        try:
+            batch = await client.messages.batches.retrieve(batch.id)
+        except Exception as exc:
+            # Transient polling failure; keep polling until the deadline.
+            if is_diagnostic_mode():
+                save_diagnostic(f"batch {batch.id} status check failed: {exc}", diagnostic_name)
 
-    return {
-        "merged_key_points": result.get("merged_key_points"),
-        "new_key_points": result.get("new_key_points", []),
-        "evaluations": result.get("evaluations", []),
-    }
+    succeeded = set()
+    try:
+        async for entry in await client.messages.batches.results(batch.id):
+            prompt = prompts.get(entry.custom_id)
+            if prompt is None or entry.result.type != "succeeded":
+                continue
+            try:
+                response_text = "".join(
+                    block.text
+                    for block in entry.result.message.content
+                    if getattr(block, "type", None) == "text"
+                )
+                parsed = _decode_llm_response(
+                    prompt, response_text, f"{diagnostic_name}_{entry.custom_id}"
+                )
+            except Exception:
+                continue
+            results[int(entry.custom_id)] = _shape_reflection_result(parsed)
+            succeeded.add(entry.custom_id)
+    except Exception as exc:
+        if is_diagnostic_mode():
+            save_diagnostic(f"batch {batch.id} results failed: {exc}", diagnostic_name)
+
+    # Only entries that did not come back usable are paid for a second time.
+    failed = [i for i in pending if str(i) not in succeeded]
+    if failed:
+        if is_diagnostic_mode():
+            save_diagnostic(
+                f"batch {batch.id}: retrying {len(failed)} entries individually",
+                diagnostic_name,
+            )
+        await _individually(failed)
+
+    return results
@@ -3,12 +3,18 @@ Document scanning utilities for extracting project-specific knowledge.
 Focuses on high-value documents while avoiding noise.
 """
 
+import asyncio
+import fnmatch
 import os
 import re
 from pathlib import Path
 from typing import List, Dict, Optional
 import json
 
+MAX_CONCURRENT_READS = 16  # files read in parallel worker threads
+MIN_CONFIG_CHARS = 50  # shorter configs are treated as empty or template-only
+
+
 async def scan_project_documents(max_documents: int = 10) -> List[Dict]:
     """
     Scan project for high-value documents containing actionable knowledge.
@@ -46,59 +52,152 @@ async def scan_project_documents(max_documents: int = 10) -> List[Dict]:
          "filter": is_meaningful_config},
     ]
 
-    # Scan and prioritize
-    for pattern_info in document_patterns:
-        if len(documents) >= max_documents:
-            break
+    # Match every pattern in one directory pass, then read and filter all
+    # candidates in worker threads
+    pattern_matches = await asyncio.to_thread(
+        _collect_pattern_matches,
+        project_root,
+        [pattern_info["pattern"] for pattern_info in document_patterns],
+    )
 
-        pattern = pattern_info["pattern"]
-        priority = pattern_info["priority"]
-        category = pattern_info["category"]
-        filter_func = pattern_info.get("filter")
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_READS)
 
-        # Find matching files
-        matches = list(project_root.glob(pattern))
-        matches.sort(key=lambda x: str(x))  # Consistent ordering
+    async def process(file_path: Path, pattern_info: Dict) -> Optional[Dict]:
+        async with semaphore:
+            return await asyncio.to_thread(_process_one, file_path, project_root, pattern_info)
 
-        for file_path in matches[:2]:  # Limit per pattern to avoid domination
-            if len(documents) >= max_documents:
-                break
+    candidates = [
+        (file_path, pattern_info)
+        for pattern_info, matches in zip(document_patterns, pattern_matches)
+        for file_path in matches
+    ]
+    processed = await asyncio.gather(*(process(path, info) for path, info in candidates))
 
-            # Skip if file doesn't exist or is too large
-            if not file_path.exists() or file_path.stat().st_size > 50000:
-                continue
+    # Keep the first hits in pattern order, as a serial scan would
+    for document in processed:
+        if len(documents) >= max_documents:
+            break
+        if document:
+            documents.append(document)
 
-            # Apply custom filter if provided
-            if filter_func and not filter_func(file_path):
-                continue
+    # Sort by priority
+    documents.sort(key=lambda x: x["priority"], reverse=True)
+    return documents[:max_documents]
 
+def _list_dir(directory: Path) -> List[os.DirEntry]:
+    try:
+        with os.scandir(directory) as it:
+            return list(it)
+    except OSError:
+        return []
+
+def _walk_dirs(directory: Path, listings: Dict[Path, List[os.DirEntry]]) -> List[Path]:
+    """directory plus all subdirectories (not following symlinks), like ``**``."""
+    dirs = [directory]
+    for sub in dirs:
+        entries = listings.get(sub)
+        if entries is None:
+            entries = listings[sub] = _list_dir(sub)
+        for entry in entries:
             try:
-                content = read_document_content(file_path, category)
-                if content and is_content_valuable(content):
-                    documents.append({
-                        "path": str(file_path.relative_to(project_root)),
-                        "content": content,
-                        "priority": priority,
-                        "category": category
-                    })
-            except Exception as e:
-                # Skip files that can't be read
+                if entry.is_dir() and not entry.is_symlink():
+                    dirs.append(sub / entry.name)
+            except OSError:
                 continue
+    return dirs
 
-    # Sort by priority
-    documents.sort(key=lambda x: x["priority"], reverse=True)
-    return documents[:max_documents]
 
-def is_heavily_documented(file_path: Path) -> bool:
-    """Check if Python file has substantial documentation."""
+def _collect_pattern_matches(project_root: Path, patterns: List[str]) -> List[List[Path]]:
+    """Resolve glob patterns like ``Path.glob`` but list each directory only once.
+
+    The patterns share a handful of directories (root, docs/, the src/ tree),
+    so caching the listings avoids re-reading them for every pattern. Each
+    result is in consistent order and limited to 2 per pattern.
+    """
+    listings: Dict[Path, List[os.DirEntry]] = {}
+    results = []
+    for pattern in patterns:
+        *dir_parts, name_pattern = pattern.split("/")
+        if "**" in dir_parts:
+            base = project_root.joinpath(*dir_parts[:dir_parts.index("**")])
+            directories = _walk_dirs(base, listings)
+        else:
+            directories = [project_root.joinpath(*dir_parts)]
+
+        matches = []
+        for directory in directories:
+            entries = listings.get(directory)
+            if entries is None:
+                entries = listings[directory] = _list_dir(directory)
+            matches.extend(
+                directory / entry.name
+                for entry in entries
+                if fnmatch.fnmatch(entry.name, name_pattern)
+            )
+        matches.sort(key=lambda x: str(x))  # Consistent ordering
+        results.append(matches[:2])  # Limit per pattern to avoid domination
+    return results
+
+def _process_one(file_path: Path, project_root: Path, pattern_info: Dict) -> Optional[Dict]:
+    """Read, filter and package one candidate file; None if it should be skipped."""
+    # Skip if file doesn't exist or is too large (one stat() covers both)
+    try:
+        size = file_path.stat().st_size
+    except OSError:
+        return None
+    if size > 50000:
+        return None
+
+    # Configs under MIN_CONFIG_CHARS bytes cannot pass is_meaningful_config
+    # (a character takes at least one byte), so skip the open and decode
+    filter_func = pattern_info.get("filter")
+    if filter_func is is_meaningful_config and size < MIN_CONFIG_CHARS:
+        return None
+
+    # Read once; the filter and the extractor share the decoded text
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+            text = f.read()
+    except (OSError, UnicodeDecodeError):
+        return None
 
-        # Count documentation indicators
+    # Apply custom filter if provided
+    if filter_func and not filter_func(file_path, text):
+        return None
+
+    try:
+        content = read_document_content(file_path, pattern_info["category"], text)
+        if content and is_content_valuable(content):
+            return {
+                "path": str(file_path.relative_to(project_root)),
+                "content": content,
+                "priority": pattern_info["priority"],
+                "category": pattern_info["category"]
+            }
+    except Exception as e:
+        # Skip files that can't be read
+        pass
+    return None
+
+def is_heavily_documented(file_path: Path, content: Optional[str] = None) -> bool:
+    """Check if Python file has substantial documentation (reads it unless content is given)."""
+    try:
+        if content is None:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
+
+        # Count documentation indicators in a single pass over the lines
         docstring_count = content.count('"""') + content.count("'''")
-        comment_lines = len([l for l in content.split('\n') if l.strip().startswith('#')])
-        content_lines = len([l for l in content.split('\n') if l.strip() and not l.strip().startswith('#')])
+        comment_lines = 0
+        content_lines = 0
+        for line in content.split('\n'):
+            stripped = line.strip()
+            if not stripped:
+                continue
+            if stripped.startswith('#'):
+                comment_lines += 1
+            else:
+                content_lines += 1
 
         # Consider heavily documented if:
         # - Has at least 2 docstrings OR
@@ -112,14 +211,15 @@ def is_heavily_documented(file_path: Path) -> bool:
     except:
         return False
 
-def is_meaningful_config(file_path: Path) -> bool:
-    """Check if configuration file has meaningful content."""
+def is_meaningful_config(file_path: Path, content: Optional[str] = None) -> bool:
+    """Check if configuration file has meaningful content (reads it unless content is given)."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if content is None:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
 
         # Skip empty or template-only configs
-        if len(content.strip()) < 50:
+        if len(content.strip()) < MIN_CONFIG_CHARS:
             return False
 
         # Skip package configs (package.json, requirements.txt unless with comments)
@@ -130,11 +230,12 @@ def is_meaningful_config(file_path: Path) -> bool:
     except:
         return False
 
-def read_document_content(file_path: Path, category: str) -> Optional[str]:
-    """Read document content with appropriate processing."""
+def read_document_content(file_path: Path, category: str, content: Optional[str] = None) -> Optional[str]:
+    """Read document content (unless already given) with appropriate processing."""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
+        if content is None:
+            with open(file_path, 'r', encoding='utf-8') as f:
+                content = f.read()
 
         # Apply category-specific processing
         if category == "core_code":
@@ -149,36 +250,77 @@ def read_document_content(file_path: Path, category: str) -> Optional[str]:
     except:
         return None
 
+# Lines outside docstrings that may be definitions or comments worth keeping.
+# Anchored on the preceding newline, which lets the scan run over slices of the
+# source without copying them.
+_CODE_DOC_CANDIDATE_RE = re.compile(r"\n([^\S\n]*(?:def |class |async def |#)[^\n]*)")
+_COMMENT_KEYWORDS = ('note:', 'warning:', 'fixme:', 'todo:', 'important:')
+
+
+def _is_code_doc_line(line: str) -> bool:
+    stripped = line.strip()
+    # Extract important comments
+    if stripped.startswith('#'):
+        lowered = stripped.lower()
+        return any(keyword in lowered for keyword in _COMMENT_KEYWORDS)
+    # Extract class/function definitions with docstrings
+    return (stripped.startswith('def ') or stripped.startswith('class ') or
+            stripped.startswith('async def '))
+
 def extract_code_documentation(python_code: str) -> str:
-    """Extract documentation and key comments from Python code."""
-    lines = python_code.split('\n')
-    extracted = []
+    """Extract documentation and key comments from Python code.
 
+    Lines containing a docstring delimiter toggle docstring state. They are
+    located with str.find; the text between them is either copied whole
+    (inside a docstring) or regex-filtered for definitions and keyword
+    comments, so plain code is never walked line by line in Python.
+    """
+    extracted = []
     in_docstring = False
-    docstring_char = None
 
-    for line in lines:
-        stripped = line.strip()
-
-        # Track docstrings
-        if '"""' in stripped or "'''" in stripped:
-            in_docstring = not in_docstring
-            if in_docstring:
-                docstring_char = '"""' if '"""' in stripped else "'''"
-            extracted.append(line)
-        elif in_docstring and docstring_char in line:
-            in_docstring = False
-            extracted.append(line)
-        elif in_docstring:
-            extracted.append(line)
-        # Extract important comments
-        elif stripped.startswith('#') and any(keyword in stripped.lower()
-                                          for keyword in ['note:', 'warning:', 'fixme:', 'todo:', 'important:']):
-            extracted.append(line)
-        # Extract class/function definitions with docstrings
-        elif (stripped.startswith('def ') or stripped.startswith('class ') or
-              stripped.startswith('async def ')):
-            extracted.append(line)
+    def take_lines(start: int, end: int) -> None:
+        # Lines python_code[start:end]; start is a line start, end a line end.
+        if in_docstring:
+            extracted.extend(python_code[start:end].split('\n'))
+            return
+        if start == 0:
+            first_end = python_code.find('\n', 0, end)
+            first = python_code[:end if first_end == -1 else first_end]
+            if _is_code_doc_line(first):
+                extracted.append(first)
+        extracted.extend(
+            m.group(1)
+            for m in _CODE_DOC_CANDIDATE_RE.finditer(python_code, max(start - 1, 0), end)
+            if _is_code_doc_line(m.group(1))
+        )
+
+    # Next position of each delimiter; a search is only repeated once passed,
+    # so a delimiter style absent from the file is not rescanned per docstring.
+    next_double = python_code.find('"""')
+    next_single = python_code.find("'''")
+    line_start = 0
+    while True:
+        if -1 < next_double < line_start:
+            next_double = python_code.find('"""', line_start)
+        if -1 < next_single < line_start:
+            next_single = python_code.find("'''", line_start)
+        if next_double == -1 and next_single == -1:
+            break
+        mark = next_double if next_single == -1 or -1 < next_double < next_single else next_single
+        mark_line_start = python_code.rfind('\n', 0, mark) + 1
+        mark_line_end = python_code.find('\n', mark + 3)
+        if mark_line_end == -1:
+            mark_line_end = len(python_code)
+
+        if mark_line_start > line_start:
+            # Complete lines before the delimiter line (without the final newline)
+            take_lines(line_start, mark_line_start - 1)
+        extracted.append(python_code[mark_line_start:mark_line_end])
+        in_docstring = not in_docstring
+        line_start = mark_line_end + 1
+
+    if line_start <= len(python_code):
+        take_lines(line_start, len(python_code))
 
     return '\n'.join(extracted)
 
@@ -194,51 +336,70 @@ def include_config_comments(config_content: str) -> str:
 
     return '\n'.join(commented_lines)
 
+# Indicators of valuable content
+_VALUABLE_INDICATORS = (
+    'because', 'reason', 'note:', 'important', 'warning',
+    'best practice', 'avoid', 'remember', 'consider',
+    'fix:', 'solution', 'approach', 'decision',
+    'performance', 'security', 'optimize'
+)
+
 def is_content_valuable(content: str) -> bool:
     """Quick check if content likely contains valuable knowledge."""
     if len(content.strip()) < 100:
         return False
 
-    # Look for indicators of valuable content
-    valuable_indicators = [
-        'because', 'reason', 'note:', 'important', 'warning',
-        'best practice', 'avoid', 'remember', 'consider',
-        'fix:', 'solution', 'approach', 'decision',
-        'performance', 'security', 'optimize'
-    ]
-
+    # Consider valuable if multiple indicators found; stop at the second one
     content_lower = content.lower()
-    indicator_count = sum(1 for indicator in valuable_indicators if indicator in content_lower)
-
-    # Consider valuable if multiple indicators found
-    return indicator_count >= 2
+    found = 0
+    for indicator in _VALUABLE_INDICATORS:
+        if indicator in content_lower:
+            found += 1
+            if found >= 2:
+                return True
+    return False
 
 # Utility function to integrate with existing extraction flow
 async def extract_document_knowledge(playbook: Dict) -> Dict:
     """Extract knowledge from project documents."""
-    from common import extract_keypoints
+    from common import extract_keypoints_batch
 
     documents = await scan_project_documents()
 
+    # merged_key_points stays None: update_playbook_data() ignores new_key_points
+    # whenever a merged list (even an empty one) is present
     if not documents:
-        return {"new_key_points": [], "merged_key_points": []}
-
-    # Prepare document content for analysis
-    document_content = "\n\n".join([
-        f"--- {doc['path']} ({doc['category']}) ---\n{doc['content']}"
-        for doc in documents
-    ])
-
-    # Extract knowledge using the document-specific prompt
-    extraction_result = await extract_keypoints(
-        [{"role": "user", "content": document_content}],
+        return {"new_key_points": [], "evaluations": [], "merged_key_points": None}
+
+    # One reflection request per document, submitted together as a batch
+    results = await extract_keypoints_batch(
+        [
+            [{"role": "user", "content": f"--- {doc['path']} ({doc['category']}) ---\n{doc['content']}"}]
+            for doc in documents
+        ],
         playbook,
         "document_extraction"
     )
 
-    # Add source information to extracted points
-    for point in extraction_result.get("new_key_points", []):
-        point["source_document"] = documents[0]["path"] if documents else "unknown"
-        point["source_type"] = "document"
-
-    return extraction_result
\ No newline at end of file
+    # Combine per-document results; attribute each point to its own document.
+    # Per-document merge proposals cannot be combined, so points are added as new.
+    new_key_points = []
+    # update_playbook_data() applies every evaluation it gets, so a key point
+    # judged by several documents keeps only the last verdict (one score move)
+    evaluations_by_name = {}
+    for doc, result in zip(documents, results):
+        for point in result.get("new_key_points", []):
+            if isinstance(point, str):
+                point = {"text": point}
+            point["source_document"] = doc["path"]
+            point["source_type"] = "document"
+            new_key_points.append(point)
+        for evaluation in result.get("evaluations", []):
+            if isinstance(evaluation, dict):
+                evaluations_by_name[evaluation.get("name", "")] = evaluation
+
+    return {
+        "new_key_points": new_key_points,
+        "evaluations": list(evaluations_by_name.values()),
+        "merged_key_points": None,
+    }
@@ -5,12 +5,20 @@ Provides centralized error logging and reporting.
 """
 
 import json
+import os
 import sys
 import traceback
-from datetime import datetime
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import Optional, Any, Dict
 
+try:
+    from .utils.json_utils import dumps_bytes as json_dumps_bytes
+except ImportError:
+    # Fallback for direct execution or testing
+    sys.path.insert(0, str(Path(__file__).parent))
+    from utils.json_utils import dumps_bytes as json_dumps_bytes
+
 
 class GlobalExceptionHandler:
     """Centralized exception handler for all hook operations."""
@@ -19,44 +27,37 @@ class GlobalExceptionHandler:
         self.install_dir = Path.home() / ".claude"
         self.log_dir = self.install_dir / "logs"
         self.log_file = self.log_dir / "exceptions.log"
-        self.max_entries = 500  # Simple limit: keep last 500 exceptions
-        self._ensure_log_directory()
+        self.diagnostic_flag = self.install_dir / "diagnostic_mode"
+        self.max_bytes = 10 * 1024 * 1024  # Rotate to exceptions.log.1 past 10 MB
+        self._fh = None
+        self._bytes_written = 0
+        self._last_traceback = ""  # Reused by handle_and_exit in diagnostic mode
 
     def _ensure_log_directory(self):
         """Ensure log directory exists."""
-        self.log_dir.mkdir(parents=True, exist_ok=True)
-
-    def _enforce_entry_limit(self):
-        """Simple entry limit: keep only the last N entries."""
-        if not self.log_file.exists():
-            return
-
-        try:
-            # Read and split entries
-            with open(self.log_file, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            entries = content.split("-" * 80)
-            # Filter out empty entries
-            entries = [entry.strip() for entry in entries if entry.strip()]
-
-            # If under limit, do nothing
-            if len(entries) <= self.max_entries:
-                return
-
-            # Keep only the last N entries
-            entries_to_keep = entries[-self.max_entries:]
-
-            # Write back the kept entries
-            with open(self.log_file, "w", encoding="utf-8") as f:
-                for entry in entries_to_keep:
-                    f.write(entry + "\n")
-                    f.write("-" * 80 + "\n")
-
-        except Exception as e:
-            # If anything goes wrong, just continue with logging
-            # Don't let cleanup prevent error logging
-            pass
+        if not self.log_dir.exists():
+            self.log_dir.mkdir(parents=True, exist_ok=True)
+
+    def _open_log(self):
+        """Open the log for appending once and reuse the handle afterwards."""
+        if self._fh is None:
+            # Created lazily so hooks that never log skip the directory check
+            self._ensure_log_directory()
+            # Unbuffered binary append: each entry is a single write()
+            self._fh = open(self.log_file, "ab", buffering=0)
+            self._bytes_written = self._fh.tell()
+        return self._fh
+
+    def _close_log(self):
+        """Close the cached log handle (it is reopened on the next write)."""
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _rotate_log(self):
+        """Move a full log aside to exceptions.log.1 and start a new one."""
+        self._close_log()
+        os.replace(self.log_file, self.log_file.with_name(self.log_file.name + ".1"))
 
     def log_exception(self,
                      exception: Exception,
@@ -78,7 +79,10 @@ class GlobalExceptionHandler:
         timestamp = datetime.now().isoformat()
         exc_type = type(exception).__name__
         exc_msg = str(exception)
-        exc_traceback = traceback.format_exc()
+        exc_traceback = "".join(
+            traceback.format_exception(type(exception), exception, exception.__traceback__)
+        )
+        self._last_traceback = exc_traceback
 
         # Generate unique log ID
         log_id = f"{timestamp.replace(':', '').replace('-', '')}_{hook_name}"
@@ -96,14 +100,15 @@ class GlobalExceptionHandler:
             "python_version": f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
         }
 
-        # Check and enforce simple entry limit
-        self._enforce_entry_limit()
-
-        # Write to log file
+        # Append one JSON object per line (JSONL)
         try:
-            with open(self.log_file, "a", encoding="utf-8") as f:
-                f.write(json.dumps(log_entry, indent=2, ensure_ascii=False) + "\n")
-                f.write("-" * 80 + "\n")
+            fh = self._open_log()
+            if self._bytes_written >= self.max_bytes:
+                self._rotate_log()
+                fh = self._open_log()
+            line = json_dumps_bytes(log_entry) + b"\n"
+            fh.write(line)
+            self._bytes_written += len(line)
         except Exception as e:
             # Fallback to stderr if logging fails
             print(f"CRITICAL: Failed to write to exception log: {e}", file=sys.stderr)
@@ -129,15 +134,18 @@ class GlobalExceptionHandler:
         """
         log_id = self.log_exception(exception, hook_name, context, session_id)
 
-        # Print user-friendly error message to stderr
-        print(f"❌ Hook execution failed in {hook_name}", file=sys.stderr)
-        print(f"📝 Error logged with ID: {log_id}", file=sys.stderr)
-        print(f"📂 Check logs at: {self.log_file}", file=sys.stderr)
+        # Print user-friendly error message to stderr in a single write
+        message = (
+            f"❌ Hook execution failed in {hook_name}\n"
+            f"📝 Error logged with ID: {log_id}\n"
+            f"📂 Check logs at: {self.log_file}\n"
+        )
 
         # In diagnostic mode, also print full traceback
-        diagnostic_flag = self.install_dir / "diagnostic_mode"
-        if diagnostic_flag.exists():
-            print(f"\n🐛 Full exception details:\n{traceback.format_exc()}", file=sys.stderr)
+        if self.diagnostic_flag.exists():
+            message += f"\n🐛 Full exception details:\n{self._last_traceback}\n"
+
+        sys.stderr.write(message)
 
         sys.exit(exit_code)
 
@@ -163,8 +171,10 @@ class GlobalExceptionHandler:
         log_id = self.log_exception(exception, hook_name, context, session_id)
 
         # Print warning to stderr
-        print(f"⚠️  Hook {hook_name} encountered an error but continuing", file=sys.stderr)
-        print(f"📝 Error logged with ID: {log_id}", file=sys.stderr)
+        sys.stderr.write(
+            f"⚠️  Hook {hook_name} encountered an error but continuing\n"
+            f"📝 Error logged with ID: {log_id}\n"
+        )
 
         # Return fallback output (empty JSON by default)
         return fallback_output or "{}"
@@ -181,6 +191,24 @@ def get_exception_handler() -> GlobalExceptionHandler:
     return _global_handler
 
 
+def _summarize_input(input_data: Any, max_chars: int = 4096) -> Dict[str, Any]:
+    """
+    Bounded summary of hook input for the exception log.
+
+    Args:
+        input_data: Hook input (usually the parsed stdin dict)
+        max_chars: Maximum length of the text sample
+
+    Returns:
+        Dict with the first 20 keys (for mappings) and a truncated sample
+    """
+    summary: Dict[str, Any] = {"type": type(input_data).__name__}
+    if hasattr(input_data, "keys"):
+        summary["keys"] = [str(key) for key in list(input_data.keys())[:20]]
+    summary["sample"] = str(input_data)[:max_chars]
+    return summary
+
+
 def hook_exception_wrapper(hook_name: str):
     """
     Decorator to wrap hook main functions with global exception handling.
@@ -206,7 +234,7 @@ def hook_exception_wrapper(hook_name: str):
 
                 # If first argument is the input data (common pattern)
                 if args and hasattr(args[0], 'get'):
-                    context = {"input_data": args[0]}
+                    context = {"input_data_summary": _summarize_input(args[0])}
                     session_id = args[0].get('session_id')
 
                 handler.handle_and_exit(e, hook_name, context, session_id)
@@ -251,35 +279,27 @@ def cleanup_old_logs(keep_days: int = 30):
     if not handler.log_file.exists():
         return
 
-    cutoff_date = datetime.now().timestamp() - (keep_days * 24 * 60 * 60)
+    # log_exception writes naive datetime.now().isoformat() stamps, which sort
+    # chronologically as plain strings
+    cutoff_iso = (datetime.now() - timedelta(days=keep_days)).isoformat()
 
-    # Read current log entries
-    current_entries = []
+    # Stream surviving lines into a temp file, then swap it in atomically
+    tmp_file = handler.log_file.with_name(handler.log_file.name + ".tmp")
+    handler._close_log()
     try:
-        with open(handler.log_file, "r", encoding="utf-8") as f:
-            content = f.read()
-            entries = content.split("-" * 80)
-
-            for entry in entries:
-                if entry.strip():
-                    try:
-                        entry_data = json.loads(entry.strip())
-                        entry_timestamp = datetime.fromisoformat(entry_data["timestamp"]).timestamp()
-                        if entry_timestamp > cutoff_date:
-                            current_entries.append(entry)
-                    except (json.JSONDecodeError, KeyError, ValueError):
-                        # Keep malformed entries just in case
-                        current_entries.append(entry)
+        with open(handler.log_file, "r", encoding="utf-8") as src, \
+                open(tmp_file, "w", encoding="utf-8") as dst:
+            for line in src:
+                if not line.strip():
+                    continue
+                try:
+                    entry_data = json.loads(line)
+                    if entry_data["timestamp"] > cutoff_iso:
+                        dst.write(line)
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    # Keep malformed entries just in case
+                    dst.write(line)
+        os.replace(tmp_file, handler.log_file)
     except Exception as e:
         print(f"Failed to clean up old logs: {e}", file=sys.stderr)
-        return
-
-    # Write back filtered entries
-    try:
-        with open(handler.log_file, "w", encoding="utf-8") as f:
-            for entry in current_entries:
-                if entry.strip():
-                    f.write(entry.strip() + "\n")
-                    f.write("-" * 80 + "\n")
-    except Exception as e:
-        print(f"Failed to write cleaned logs: {e}", file=sys.stderr)
\ No newline at end of file
+        tmp_file.unlink(missing_ok=True)
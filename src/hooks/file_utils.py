@@ -1,19 +1,74 @@
 #!/usr/bin/env python3
 """File utilities for loading transcripts and templates."""
+import functools
 import json
+import mmap
+import os
 from pathlib import Path
 
 # Import path utilities
 try:
+    from .utils.json_utils import loads as json_loads
     from .utils.path_utils import get_user_claude_dir
 except ImportError:
     # Fallback for direct execution or testing
     import sys
     from pathlib import Path
     sys.path.insert(0, str(Path(__file__).parent))
+    from utils.json_utils import loads as json_loads
     from utils.path_utils import get_user_claude_dir
 
 
+# Transcripts above this size are memory-mapped instead of read through a buffer
+MMAP_THRESHOLD = 64 * 1024
+
+
+def _collect_conversations(lines, conversations: list[dict]) -> None:
+    """Append user/assistant messages parsed from raw JSONL lines."""
+    for line in lines:
+        if not line.strip():
+            continue
+
+        # Claude Code writes compact JSONL, so a raw substring check rejects
+        # non-conversation and meta entries without paying for a JSON decode.
+        if b'"type":"user"' not in line and b'"type":"assistant"' not in line:
+            continue
+        if b'"isMeta":true' in line or b'"isVisibleInTranscriptOnly":true' in line:
+            continue
+
+        entry = json_loads(line)
+
+        if entry.get("type") not in ["user", "assistant"]:
+            continue
+        if entry.get("isMeta") or entry.get("isVisibleInTranscriptOnly"):
+            continue
+
+        message = entry.get("message", {})
+        role = message.get("role")
+        content = message.get("content", "")
+
+        if not role or not content:
+            continue
+
+        if isinstance(content, str) and (
+            "<command-name>" in content or "<local-command-stdout>" in content
+        ):
+            continue
+
+        if isinstance(content, list):
+            text_parts = [
+                item.get("text", "")
+                for item in content
+                if isinstance(item, dict) and item.get("type") == "text"
+            ]
+            if text_parts:
+                conversations.append(
+                    {"role": role, "content": "\n".join(text_parts)}
+                )
+        else:
+            conversations.append({"role": role, "content": content})
+
+
 def load_transcript(transcript_path: str) -> list[dict]:
     """Load and parse transcript from file.
 
@@ -32,44 +87,16 @@ def load_transcript(transcript_path: str) -> list[dict]:
         return conversations
 
     try:
-        with open(transcript_path, "r", encoding="utf-8") as f:
-            for line in f:
-                if not line.strip():
-                    continue
-
-                entry = json.loads(line)
-
-                if entry.get("type") not in ["user", "assistant"]:
-                    continue
-                if entry.get("isMeta") or entry.get("isVisibleInTranscriptOnly"):
-                    continue
-
-                message = entry.get("message", {})
-                role = message.get("role")
-                content = message.get("content", "")
-
-                if not role or not content:
-                    continue
-
-                if isinstance(content, str) and (
-                    "<command-name>" in content or "<local-command-stdout>" in content
-                ):
-                    continue
-
-                if isinstance(content, list):
-                    text_parts = [
-                        item.get("text", "")
-                        for item in content
-                        if isinstance(item, dict) and item.get("type") == "text"
-                    ]
-                    if text_parts:
-                        conversations.append(
-                            {"role": role, "content": "\n".join(text_parts)}
-                        )
-                else:
-                    conversations.append({"role": role, "content": content})
-
-    except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
+        # Transcripts grow to many MB; small ones are read in 64 KB chunks and
+        # larger ones are memory-mapped so lines are sliced from the page cache.
+        with open(transcript_path, "rb", buffering=1 << 16) as f:
+            if os.fstat(f.fileno()).st_size > MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    _collect_conversations(iter(mm.readline, b""), conversations)
+            else:
+                _collect_conversations(f, conversations)
+
+    except (json.JSONDecodeError, IOError, UnicodeDecodeError, ValueError) as e:
         # Log the error but don't crash - return empty conversations
         # This allows hooks to continue gracefully even with corrupted transcript files
         pass
@@ -77,8 +104,9 @@ def load_transcript(transcript_path: str) -> list[dict]:
     return conversations
 
 
+@functools.lru_cache(maxsize=16)
 def load_template(template_name: str) -> str:
-    """Load template from file.
+    """Load template from file (cached per name for the life of the process).
 
     Args:
         template_name: Name of the template file
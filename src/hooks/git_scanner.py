@@ -3,6 +3,7 @@ Git history scanner for extracting high-value technical decisions.
 Focuses on architectural decisions and significant implementations.
 """
 
+import asyncio
 import os
 import re
 import subprocess
@@ -11,6 +12,64 @@ from pathlib import Path
 from typing import Dict, List, Optional
 
 
+# Look for architectural decisions
+_ARCH_PATTERNS = [
+    r"architecture",
+    r"redesign",
+    r"refactor.*major",
+    r"implement.*system",
+    r"add.*support for",
+    r"migrate.*to",
+]
+
+# Look for performance optimizations
+_PERF_PATTERNS = [
+    r"performance",
+    r"optimization",
+    r"speed.*up",
+    r"reduce.*time",
+    r"improve.*efficiency",
+    r"\+\d+%",  # Performance metrics
+]
+
+# Look for important fixes
+_FIX_PATTERNS = [
+    r"fix.*critical",
+    r"security",
+    r"data.*loss",
+    r"memory.*leak",
+    r"race.*condition",
+]
+
+# One alternation matches wherever any single pattern would
+_HIGH_VALUE_RE = re.compile("|".join(_ARCH_PATTERNS + _PERF_PATTERNS + _FIX_PATTERNS))
+
+# File paths or code references, and numbers with units
+_CODE_REF_RE = re.compile(r"\w+\.\w+:\d+")
+_METRIC_RE = re.compile(r"\d+\s*(ms|s|%|mb|kb)")
+
+# git log output uses NUL between fields and RS after each commit, since
+# subjects and bodies may contain "|" and newlines
+_FIELD_SEP = b"\x00"
+_RECORD_SEP = b"\x1e"
+
+_TECH_TERMS = (
+    "algorithm",
+    "implementation",
+    "interface",
+    "api",
+    "database",
+    "cache",
+    "queue",
+    "thread",
+    "async",
+    "timeout",
+    "retry",
+    "fallback",
+    "deprecated",
+)
+
+
 async def scan_git_history(since_months: int = 3, max_commits: int = 20) -> List[Dict]:
     """
     Scan Git history for high-value commits.
@@ -28,38 +87,35 @@ async def scan_git_history(since_months: int = 3, max_commits: int = 20) -> List
             "git",
             "log",
             f"--since={since_months} months ago",
-            "--max-count={max_commits}",
-            "--pretty=format:%H|%s|%b|%an|%ad|%P",
+            f"--max-count={max_commits}",
+            "--pretty=format:%H%x00%s%x00%b%x00%an%x00%ad%x00%P%x1e",
             "--date=iso",
             "--no-merges",  # Skip merge commits
         ]
 
-        result = subprocess.run(cmd, cwd=project_root, capture_output=True, text=True)
+        result = await asyncio.to_thread(
+            subprocess.run, cmd, cwd=project_root, capture_output=True
+        )
 
         if result.returncode != 0:
             return []
 
         commits = []
-        for line in result.stdout.strip().split("\n"):
-            if not line:
+        for parts in _split_log_records(result.stdout, 6):
+            # Quality filter, before building the commit dict
+            if not is_high_value_message(parts[1], parts[2]):
                 continue
 
-            parts = line.split("|", 4)
-            if len(parts) < 5:
-                continue
-
-            commit = {
-                "hash": parts[0],
-                "subject": parts[1],
-                "body": parts[2],
-                "author": parts[3],
-                "date": parts[4],
-                "parents": parts[4] if len(parts) > 4 else "",
-            }
-
-            # Quality filter
-            if is_high_value_commit(commit):
-                commits.append(commit)
+            commits.append(
+                {
+                    "hash": parts[0],
+                    "subject": parts[1],
+                    "body": parts[2],
+                    "author": parts[3],
+                    "date": parts[4],
+                    "parents": parts[5],
+                }
+            )
 
         return commits
 
@@ -67,56 +123,47 @@ async def scan_git_history(since_months: int = 3, max_commits: int = 20) -> List
         return []
 
 
+def _split_log_records(output: bytes, field_count: int) -> List[List[str]]:
+    """Split NUL/RS separated git log output into decoded field lists."""
+    records = []
+    for record in output.split(_RECORD_SEP):
+        record = record.lstrip(b"\n")
+        if not record:
+            continue
+
+        parts = record.split(_FIELD_SEP, field_count - 1)
+        if len(parts) < field_count:
+            continue
+
+        fields = [part.decode("utf-8", errors="replace") for part in parts]
+        fields[2] = fields[2].strip()  # %b ends with a newline
+        records.append(fields)
+
+    return records
+
+
 def is_high_value_commit(commit: Dict) -> bool:
     """Determine if a commit contains valuable knowledge."""
+    return is_high_value_message(commit["subject"], commit["body"])
+
+
+def is_high_value_message(subject: str, body: str) -> bool:
+    """Determine if a commit subject and body contain valuable knowledge."""
 
     # Skip if no detailed body
-    if not commit["body"] or len(commit["body"].strip()) < 100:
+    if not body or len(body.strip()) < 100:
         return False
 
     # Skip revert commits (handled separately)
-    if commit["subject"].startswith("Revert"):
+    if subject.startswith("Revert"):
         return False
 
     # High-value indicators
-    subject = commit["subject"].lower()
-    body = commit["body"].lower()
-
-    # Look for architectural decisions
-    arch_patterns = [
-        r"architecture",
-        r"redesign",
-        r"refactor.*major",
-        r"implement.*system",
-        r"add.*support for",
-        r"migrate.*to",
-    ]
-
-    # Look for performance optimizations
-    perf_patterns = [
-        r"performance",
-        r"optimization",
-        r"speed.*up",
-        r"reduce.*time",
-        r"improve.*efficiency",
-        r"\+\d+%",  # Performance metrics
-    ]
-
-    # Look for important fixes
-    fix_patterns = [
-        r"fix.*critical",
-        r"security",
-        r"data.*loss",
-        r"memory.*leak",
-        r"race.*condition",
-    ]
-
-    # Check if any pattern matches
-    all_patterns = arch_patterns + perf_patterns + fix_patterns
-
-    for pattern in all_patterns:
-        if re.search(pattern, subject + " " + body):
-            return True
+    subject = subject.lower()
+    body = body.lower()
+
+    if _HIGH_VALUE_RE.search(subject + " " + body):
+        return True
 
     # Look for detailed technical explanations
     if has_technical_details(body):
@@ -132,36 +179,20 @@ def has_technical_details(body: str) -> bool:
     indicators = 0
 
     # Code examples
-    if re.search(r"```", body):
+    if "```" in body:
         indicators += 2
 
     # File paths or code references
-    if re.search(r"\w+\.\w+:\d+", body):
+    if _CODE_REF_RE.search(body):
         indicators += 1
 
     # Technical terms
-    tech_terms = [
-        "algorithm",
-        "implementation",
-        "interface",
-        "api",
-        "database",
-        "cache",
-        "queue",
-        "thread",
-        "async",
-        "timeout",
-        "retry",
-        "fallback",
-        "deprecated",
-    ]
-
-    for term in tech_terms:
+    for term in _TECH_TERMS:
         if term in body:
             indicators += 1
 
     # Numbers with units (performance metrics)
-    if re.search(r"\d+\s*(ms|s|%|mb|kb)", body):
+    if _METRIC_RE.search(body):
         indicators += 2
 
     return indicators >= 3
@@ -178,29 +209,24 @@ def extract_revert_commits(since_months: int = 3) -> List[Dict]:
             "log",
             f"--since={since_months} months ago",
             "--grep=^Revert",
-            "--pretty=format:%H|%s|%b|%an|%ad",
+            "--pretty=format:%H%x00%s%x00%b%x00%an%x00%ad%x1e",
             "--date=iso",
         ]
 
-        result = subprocess.run(cmd, cwd=project_root, capture_output=True, text=True)
+        result = subprocess.run(cmd, cwd=project_root, capture_output=True)
 
         reverts = []
-        for line in result.stdout.strip().split("\n"):
-            if not line:
-                continue
-
-            parts = line.split("|", 4)
-            if len(parts) >= 5:
-                reverts.append(
-                    {
-                        "hash": parts[0],
-                        "subject": parts[1],
-                        "body": parts[2],
-                        "author": parts[3],
-                        "date": parts[4],
-                        "type": "revert",
-                    }
-                )
+        for parts in _split_log_records(result.stdout, 5):
+            reverts.append(
+                {
+                    "hash": parts[0],
+                    "subject": parts[1],
+                    "body": parts[2],
+                    "author": parts[3],
+                    "date": parts[4],
+                    "type": "revert",
+                }
+            )
 
         return reverts
 
@@ -211,11 +237,12 @@ def extract_revert_commits(since_months: int = 3) -> List[Dict]:
 async def extract_git_knowledge(playbook: Dict) -> Dict:
     """Extract knowledge from Git history."""
 
-    # Get high-value commits
-    valuable_commits = await scan_git_history(since_months=3, max_commits=50)
-
-    # Get revert commits (learning from failures)
-    revert_commits = extract_revert_commits(since_months=3)
+    # Get high-value commits and revert commits (learning from failures);
+    # the two git log processes run side by side
+    valuable_commits, revert_commits = await asyncio.gather(
+        scan_git_history(since_months=3, max_commits=50),
+        asyncio.to_thread(extract_revert_commits, since_months=3),
+    )
 
     # Prepare content for analysis
     git_content = []
@@ -1,9 +1,18 @@
 """Playbook engine module for managing playbook data operations."""
 
+import functools
+import heapq
 import json
+import os
+import re
 import sys
 from typing import Optional
 
+MAX_KEYPOINTS = 250  # hard cap to keep playbook manageable
+
+# Splits tags into alphanumeric tokens for overlap matching.
+_TOKEN_SPLIT_RE = re.compile(r"[^a-z0-9]+")
+
 
 def generate_keypoint_name(existing_names: set) -> str:
     """Generate a unique keypoint name in the format 'kpt_XXX'.
@@ -14,6 +23,11 @@ def generate_keypoint_name(existing_names: set) -> str:
     Returns:
         str: A unique keypoint name like 'kpt_001'
     """
+    return f"kpt_{_max_keypoint_number(existing_names) + 1:03d}"
+
+
+def _max_keypoint_number(existing_names) -> int:
+    """Return the highest numeric suffix among 'kpt_XXX' names (0 if none)."""
     max_num = 0
     for name in existing_names:
         if name.startswith("kpt_"):
@@ -22,34 +36,84 @@ def generate_keypoint_name(existing_names: set) -> str:
                 max_num = max(max_num, num)
             except (IndexError, ValueError):
                 continue
+    return max_num
+
+
+@functools.lru_cache(maxsize=4096)
+def _tag_tokens(norm: str) -> frozenset:
+    """Alphanumeric tokens of a lowercase tag (tags repeat heavily across keypoints)."""
+    return frozenset(token for token in _TOKEN_SPLIT_RE.split(norm) if token)
+
+
+def _tag_token_map(tags: list) -> dict[str, frozenset]:
+    """Map each lowercase tag to the frozenset of its alphanumeric tokens."""
+    token_map = {}
+    for tag in tags:
+        if isinstance(tag, str):
+            norm = tag.lower()
+            if norm not in token_map:
+                token_map[norm] = _tag_tokens(norm)
+    return token_map
+
+
+class NameAllocator:
+    """Hands out sequential 'kpt_XXX' names for one load/update pass.
+
+    The highest existing suffix is scanned once up front, so allocating many
+    names inside a loop is O(1) each instead of rescanning every name.
+    """
+
+    def __init__(self, existing_names):
+        self._max = _max_keypoint_number(existing_names)
+
+    def next(self) -> str:
+        self._max += 1
+        return f"kpt_{self._max:03d}"
+
 
-    return f"kpt_{max_num + 1:03d}"
+class KeypointIndex:
+    """Name and text lookups over a keypoint list, kept current as items are added.
+
+    Later keypoints win on duplicate keys, matching a dict comprehension.
+    """
+
+    def __init__(self, key_points: list[dict]):
+        self.by_name = {}
+        self.by_text = {}
+        for kp in key_points:
+            self.add(kp)
+
+    def add(self, kp: dict) -> None:
+        self.by_name[kp["name"]] = kp
+        self.by_text[kp.get("text", "")] = kp
 
 
+@functools.lru_cache(maxsize=1)
 def load_settings() -> dict:
     """Load settings from user's claude directory.
 
+    The result is cached for the life of the (short-lived) hook process and
+    must be treated as read-only.
+
     Returns:
         dict: Settings dictionary with default values if file doesn't exist
     """
     try:
+        from .utils.json_utils import loads as json_loads
         from .utils.path_utils import get_user_claude_dir
     except ImportError:
         import sys
         from pathlib import Path
 
         sys.path.insert(0, str(Path(__file__).parent / "utils"))
+        from json_utils import loads as json_loads
         from path_utils import get_user_claude_dir
 
     settings_path = get_user_claude_dir() / "settings.json"
 
-    if not settings_path.exists():
-        return {"playbook_update_on_exit": False, "playbook_update_on_clear": False}
-
+    # A missing file lands in the except branch below, no separate exists() probe.
     try:
-        with open(settings_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return data
+        return json_loads(settings_path.read_bytes())
     except Exception:
         return {"playbook_update_on_exit": False, "playbook_update_on_clear": False}
 
@@ -106,6 +170,7 @@ def validate_playbook_structure(data: dict) -> bool:
 def load_playbook() -> dict:
     """Load playbook with intelligent migration and version control."""
     try:
+        from .utils.json_utils import loads as json_loads
         from .utils.path_utils import (
             get_project_dir,
             is_diagnostic_mode,
@@ -118,21 +183,20 @@ def load_playbook() -> dict:
         from pathlib import Path
 
         sys.path.insert(0, str(Path(__file__).parent / "utils"))
+        from json_utils import loads as json_loads
         from path_utils import get_project_dir, is_diagnostic_mode, save_diagnostic
         from tag_utils import infer_tags_from_text, normalize_tags
     import sys
 
     playbook_path = get_project_dir() / ".claude" / "playbook.json"
 
-    if not playbook_path.exists():
-        return {"version": "1.0", "last_updated": None, "key_points": []}
-
     def _is_divider(entry: object) -> bool:
         return isinstance(entry, dict) and entry.get("divider") is True
 
     try:
-        with open(playbook_path, "r", encoding="utf-8") as f:
-            data = json.load(f)
+        # One read() of the whole file instead of json.load's buffered reads;
+        # a missing file surfaces here instead of costing a separate stat().
+        data = json_loads(playbook_path.read_bytes())
 
         # Validate playbook structure
         if not validate_playbook_structure(data):
@@ -152,13 +216,18 @@ def load_playbook() -> dict:
 
         keypoints = []
         existing_names = set()
+        name_allocator = NameAllocator(
+            item["name"]
+            for item in data["key_points"]
+            if isinstance(item, dict) and isinstance(item.get("name"), str)
+        )
 
         for item in data["key_points"]:
             if _is_divider(item):
                 continue
             if isinstance(item, str):
                 keypoint = {
-                    "name": generate_keypoint_name(existing_names),
+                    "name": name_allocator.next(),
                     "text": item,
                     "score": 0,
                     "pending": False,
@@ -170,7 +239,7 @@ def load_playbook() -> dict:
             elif isinstance(item, dict):
                 keypoint = dict(item)
                 if "name" not in keypoint:
-                    keypoint["name"] = generate_keypoint_name(existing_names)
+                    keypoint["name"] = name_allocator.next()
                 if "score" not in keypoint:
                     keypoint["score"] = 0
                 if "pending" not in keypoint:
@@ -195,6 +264,8 @@ def load_playbook() -> dict:
             keypoint["tags"] = normalize_tags(keypoint.get("tags", []))
             if not keypoint["tags"]:
                 keypoint["tags"] = infer_tags_from_text(keypoint.get("text", ""))
+            # Runtime-only cache for select_relevant_keypoints; stripped on save.
+            keypoint["_tag_tokens"] = _tag_token_map(keypoint["tags"])
 
             existing_names.add(keypoint["name"])
             keypoints.append(keypoint)
@@ -202,6 +273,8 @@ def load_playbook() -> dict:
         data["key_points"] = keypoints
         return data
 
+    except FileNotFoundError:
+        return {"version": "1.0", "last_updated": None, "key_points": []}
     except (json.JSONDecodeError, IOError, UnicodeDecodeError) as e:
         # Handle specific file-related errors
         print(f"Warning: Error loading playbook ({e}), using default", file=sys.stderr)
@@ -222,25 +295,37 @@ def save_playbook(playbook: dict) -> bool:
     from datetime import datetime
 
     try:
+        from .utils.json_utils import dumps_bytes
         from .utils.path_utils import get_project_dir
     except ImportError:
         import sys
         from pathlib import Path
 
         sys.path.insert(0, str(Path(__file__).parent / "utils"))
+        from json_utils import dumps_bytes
         from path_utils import get_project_dir
 
     playbook["last_updated"] = datetime.now().isoformat()
     playbook_path = get_project_dir() / ".claude" / "playbook.json"
     playbook_path.parent.mkdir(parents=True, exist_ok=True)
 
-    # Insert a visual divider between stable items and pending ones for readability.
-    existing = [kp for kp in playbook.get("key_points", []) if not kp.get("pending")]
-    pending = [kp for kp in playbook.get("key_points", []) if kp.get("pending")]
+    def _in_range(value: object, low: float, high: float) -> bool:
+        return isinstance(value, (int, float)) and low <= value <= high
 
     def _serialize_kp(kp: dict, force_pending: bool = False) -> dict:
         """Serialize a keypoint with enhanced field validation for multi-dimensional data."""
+        # Keypoints already in storage form are written as-is, without a copy.
+        if (
+            "_tag_tokens" not in kp
+            and (kp.get("pending") is True if force_pending else "pending" not in kp)
+            and _in_range(kp.get("effect_rating"), 0, 1)
+            and _in_range(kp.get("risk_level"), -1, 1)
+            and _in_range(kp.get("innovation_level"), 0, 1)
+        ):
+            return kp
+
         item = dict(kp)  # 浅拷贝所有字段，包括新字段
+        item.pop("_tag_tokens", None)
 
         is_pending = bool(item.get("pending")) or force_pending
         if is_pending:
@@ -276,7 +361,15 @@ def save_playbook(playbook: dict) -> bool:
 
         return item
 
-    serialized_keypoints = [_serialize_kp(kp) for kp in existing]
+    # Partition in a single pass, then insert a visual divider between stable
+    # items and pending ones for readability.
+    serialized_keypoints = []
+    pending = []
+    for kp in playbook.get("key_points", []):
+        if kp.get("pending"):
+            pending.append(_serialize_kp(kp, force_pending=True))
+        else:
+            serialized_keypoints.append(_serialize_kp(kp))
     if pending:
         serialized_keypoints.append(
             {
@@ -284,20 +377,23 @@ def save_playbook(playbook: dict) -> bool:
                 "text": "--- pending key points below ---",
             }
         )
-        serialized_keypoints.extend(
-            _serialize_kp(kp, force_pending=True) for kp in pending
-        )
+        serialized_keypoints.extend(pending)
 
     payload = dict(playbook)
+    payload.pop("_rev", None)
     payload["key_points"] = serialized_keypoints
 
     # Atomic write: write to temp file first, then move
-    temp_path = playbook_path.with_suffix(".tmp")
+    temp_path = playbook_path.with_suffix(".json.tmp")
     try:
-        with open(temp_path, "w", encoding="utf-8") as f:
-            json.dump(payload, f, indent=2, ensure_ascii=False)
+        # Serialize once and hand the whole buffer to a single write.
+        data = dumps_bytes(payload, indent=True)
+        with open(temp_path, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
         # Atomic move
-        temp_path.replace(playbook_path)
+        os.replace(temp_path, playbook_path)
         return True
     except Exception as e:
         # Clean up temp file if something goes wrong
@@ -372,14 +468,21 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
         "moderately_harmful": -2,
         "highly_dangerous": -4,
     }
-    name_to_kp = {kp["name"]: kp for kp in playbook["key_points"]}
+    # One index for the whole update; additions below keep it current.
+    index = KeypointIndex(playbook["key_points"])
+    name_to_kp = index.by_name
+    # Seed the allocator once; every new keypoint below just increments it.
+    name_allocator = NameAllocator(name_to_kp)
 
     # Apply evaluations first so scores are updated before merges.
-    for eval_item in evaluations:
-        name = eval_item.get("name", "")
-        rating = eval_item.get("rating", "neutral")
-        if name in name_to_kp:
-            name_to_kp[name]["score"] += rating_delta.get(rating, 0)
+    deltas = [
+        (e.get("name", ""), rating_delta.get(e.get("rating", "neutral"), 0))
+        for e in evaluations
+    ]
+    for name, delta in deltas:
+        kp = name_to_kp.get(name)
+        if kp is not None:
+            kp["score"] += delta
 
     if merged_key_points is not None:
         # If model proposes fewer merged KPTs than existing ones, treat them as additions
@@ -387,9 +490,7 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
         if merged_key_points and len(merged_key_points) < len(
             playbook.get("key_points", [])
         ):
-            existing_names = {kp["name"] for kp in playbook["key_points"]}
-            existing_texts = {kp.get("text", "") for kp in playbook["key_points"]}
-            name_index = {kp["name"]: kp for kp in playbook["key_points"]}
+            name_index = index.by_name
 
             for item in merged_key_points:
                 if isinstance(item, str):
@@ -403,7 +504,7 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
                 else:
                     continue
 
-                if not text or text in existing_texts:
+                if not text or text in index.by_text:
                     continue
 
                 source_kps = [name_index[s] for s in sources if s in name_index]
@@ -412,27 +513,24 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
                     (kp.get("tags", []) for kp in source_kps if kp.get("tags")), []
                 )
 
-                name = generate_keypoint_name(existing_names)
-                playbook["key_points"].append(
-                    {
-                        "name": name,
-                        "text": text,
-                        "score": total_score,
-                        "tags": tags
-                        or normalize_tags(fallback_tags)
-                        or infer_tags_from_text(text),
-                        "pending": False,
-                    }
-                )
-                existing_names.add(name)
-                existing_texts.add(text)
+                new_kp = {
+                    "name": name_allocator.next(),
+                    "text": text,
+                    "score": total_score,
+                    "tags": tags
+                    or normalize_tags(fallback_tags)
+                    or infer_tags_from_text(text),
+                    "pending": False,
+                }
+                playbook["key_points"].append(new_kp)
+                index.add(new_kp)
 
-        # Rebuild indices after any additions so downstream merge logic has mappings.
-        existing_names = {kp["name"] for kp in playbook["key_points"]}
-        text_index = {kp.get("text", ""): kp for kp in playbook["key_points"]}
-        name_index = {kp["name"]: kp for kp in playbook["key_points"]}
+        # The index already covers any additions above.
+        text_index = index.by_text
+        name_index = index.by_name
 
         merged_list = []
+        merged_names = set()
         seen_texts = set()
         used_names = set()
 
@@ -472,14 +570,10 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
                 total_score = 0
                 fallback_tags = []
 
-            name = (
-                source_kp["name"]
-                if source_kp
-                else generate_keypoint_name(existing_names)
-            )
+            name = source_kp["name"] if source_kp else name_allocator.next()
 
-            if any(kp.get("name") == name for kp in merged_list):
-                name = generate_keypoint_name(existing_names)
+            if name in merged_names:
+                name = name_allocator.next()
 
             merged_list.append(
                 {
@@ -493,25 +587,23 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
                 }
             )
             seen_texts.add(text)
-            existing_names.add(name)
+            merged_names.add(name)
 
-        # Preserve any existing items that were not part of the merged output.
+        # Preserve any existing items that were not part of the merged output
+        # (first occurrence wins when several share the same text).
         for kp in playbook.get("key_points", []):
-            name = kp.get("name")
-            text = kp.get("text", "")
-            if name in used_names:
+            if kp.get("name") in used_names:
                 continue
+            text = kp.get("text", "")
             if text in seen_texts:
                 continue
-            merged_list.append(kp)
             seen_texts.add(text)
+            merged_list.append(kp)
 
         playbook["key_points"] = merged_list
 
     else:
         # Backward compatibility: treat returned new_key_points as pending additions.
-        existing_names = {kp["name"] for kp in playbook["key_points"]}
-        existing_texts = {kp["text"] for kp in playbook["key_points"]}
 
         for item in new_key_points:
             if isinstance(item, str):
@@ -523,10 +615,10 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
             else:
                 continue
 
-            if not text or text in existing_texts:
+            if not text or text in index.by_text:
                 continue
 
-            name = generate_keypoint_name(existing_names)
+            name = name_allocator.next()
 
             # Extract multi-dimensional assessment for new key points
             effect_rating = (
@@ -546,37 +638,40 @@ def update_playbook_data(playbook: dict, extraction_result: dict) -> dict:
             # Clamp to reasonable range
             initial_score = max(-2, min(3, initial_score))
 
-            playbook["key_points"].append(
-                {
-                    "name": name,
-                    "text": text,
-                    "score": initial_score,  # Use calculated initial score
-                    "tags": tags or infer_tags_from_text(text),
-                    "pending": True,
-                    "effect_rating": effect_rating,
-                    "risk_level": risk_level,
-                    "innovation_level": innovation_level,
-                }
-            )
-            existing_names.add(name)
-            existing_texts.add(text)
+            new_kp = {
+                "name": name,
+                "text": text,
+                "score": initial_score,  # Use calculated initial score
+                "tags": tags or infer_tags_from_text(text),
+                "pending": True,
+                "effect_rating": effect_rating,
+                "risk_level": risk_level,
+                "innovation_level": innovation_level,
+            }
+            playbook["key_points"].append(new_kp)
+            index.add(new_kp)
 
     # Drop low-score items.
     playbook["key_points"] = [
         kp for kp in playbook["key_points"] if kp.get("score", 0) > -5
     ]
 
-    # Enforce a hard cap by score to keep playbook size bounded.
-    if len(playbook["key_points"]) > 250:
-        playbook["key_points"] = sorted(
+    # Enforce a hard cap by score to keep playbook size bounded. nsmallest keeps
+    # sorted(...)[:MAX_KEYPOINTS] ordering without sorting the whole list.
+    if len(playbook["key_points"]) > MAX_KEYPOINTS:
+        playbook["key_points"] = heapq.nsmallest(
+            MAX_KEYPOINTS,
             playbook["key_points"],
             key=lambda kp: (-kp.get("score", 0), kp.get("name", "")),
-        )[:250]
+        )
 
     # Renumber key points sequentially to keep identifiers compact.
     for idx, kp in enumerate(playbook["key_points"], start=1):
         kp["name"] = f"kpt_{idx:03d}"
 
+    # Runtime-only revision counter; invalidates cached tag aggregates.
+    playbook["_rev"] = playbook.get("_rev", 0) + 1
+
     return playbook
 
 
@@ -597,8 +692,6 @@ def select_relevant_keypoints(
     - Balanced (0.4-0.6): 50% each layer
     - Exploratory (0.7-1.0): 30% Layer 1, 70% Layer 2
     """
-    import re
-
     key_points = playbook.get("key_points", [])
     if not key_points:
         # 如果playbook为空，记录诊断信息
@@ -635,26 +728,47 @@ def select_relevant_keypoints(
     # Define clear classification boundaries
     HIGH_CONFIDENCE_THRESHOLD = 2.0
 
-    def tag_match_score(kp_tag: str, desired: str) -> int:
-        """Exact =3, substring = 2, token overlap = 1, else 0."""
-        if kp_tag == desired:
-            return 3
-        if kp_tag in desired or desired in kp_tag:
-            return 2
-        kp_tokens = set(re.split(r"[^a-z0-9]+", kp_tag))
-        desired_tokens = set(re.split(r"[^a-z0-9]+", desired))
-        kp_tokens.discard("")
-        desired_tokens.discard("")
-        return 1 if kp_tokens & desired_tokens else 0
-
-    def score_and_coverage(kp_tags: list[str]) -> tuple[int, int, int]:
+    # Build the tag indexes once per call: exact tag -> keypoint indices and
+    # token -> distinct tags containing it. Loaded keypoints carry their
+    # normalized tag tokens already, so nothing is re-split here.
+    kp_tag_tokens = [
+        kp.get("_tag_tokens") or _tag_token_map(kp.get("tags", []))
+        for kp in key_points
+    ]
+    exact_index: dict[str, set[int]] = {}
+    token_index: dict[str, set[str]] = {}
+    for idx, tag_tokens in enumerate(kp_tag_tokens):
+        for kp_norm, tokens in tag_tokens.items():
+            if kp_norm not in exact_index:
+                exact_index[kp_norm] = set()
+                for token in tokens:
+                    token_index.setdefault(token, set()).add(kp_norm)
+            exact_index[kp_norm].add(idx)
+
+    # Match score per (desired, distinct kp tag):
+    # exact = 3, substring = 2, token overlap = 1, else 0.
+    tag_scores: dict[str, dict[str, int]] = {}
+    candidates: set[int] = set()
+    for desired in desired_tags:
+        scores = tag_scores.setdefault(desired, {})
+        for token in _tag_tokens(desired):
+            for kp_norm in token_index.get(token, ()):
+                scores[kp_norm] = 1
+        for kp_norm in exact_index:
+            if kp_norm in desired or desired in kp_norm:
+                scores[kp_norm] = 2
+        if desired in exact_index:
+            scores[desired] = 3
+        for kp_norm in scores:
+            candidates |= exact_index[kp_norm]
+
+    def score_and_coverage(kp_tags) -> tuple[int, int, int]:
         best = 0
         matched = set()
         prompt_hits = 0
-        for kp_tag in kp_tags:
-            kp_norm = kp_tag.lower()
+        for kp_norm in kp_tags:
             for desired in desired_tags:
-                s = tag_match_score(kp_norm, desired)
+                s = tag_scores[desired].get(kp_norm, 0)
                 if s > 0:
                     matched.add(desired)
                     if desired in prompt_tag_set:
@@ -668,9 +782,10 @@ def select_relevant_keypoints(
     high_confidence_layer = []  # Layer 1: score >= 2
     recommendation_layer = []  # Layer 2: 0 <= score < 2
 
-    for kp in key_points:
-        kp_tags = [t for t in kp.get("tags", []) if isinstance(t, str)]
-        score, coverage, prompt_hits = score_and_coverage(kp_tags)
+    # Keypoints outside the candidate set cannot match any desired tag.
+    for idx in sorted(candidates):
+        kp = key_points[idx]
+        score, coverage, prompt_hits = score_and_coverage(kp_tag_tokens[idx])
 
         # Skip negative scoring items entirely
         kp_score = kp.get("score", 0)
@@ -735,20 +850,29 @@ def select_relevant_keypoints(
                 if risk_level > risk_threshold:
                     temp_multiplier *= 0.8
 
-            # Store metadata for debugging
-            kp["_layer"] = layer_type
-            kp["_base_weight"] = base_weight
-            kp["_temp_multiplier"] = temp_multiplier
-            kp["_total_match"] = base_weight * temp_multiplier
-            kp["_match_score"] = score
-            kp["_match_coverage"] = coverage
-            kp["_prompt_hits"] = prompt_hits
+            # Rank by (-total_match, idx): idx keeps ties in playbook order.
+            # Debug metadata is only written onto the keypoints that get selected.
+            total_match = base_weight * temp_multiplier
+            entry = (
+                -total_match,
+                idx,
+                kp,
+                (
+                    layer_type,
+                    base_weight,
+                    temp_multiplier,
+                    total_match,
+                    score,
+                    coverage,
+                    prompt_hits,
+                ),
+            )
 
             # CLASSIFY INTO CORRECT LAYER
             if layer_type == "HIGH_CONFIDENCE":
-                high_confidence_layer.append(kp)
+                high_confidence_layer.append(entry)
             else:
-                recommendation_layer.append(kp)
+                recommendation_layer.append(entry)
 
     # TEMPERATURE-BASED ALLOCATION PHASE
     if temperature <= 0.3:
@@ -764,53 +888,46 @@ def select_relevant_keypoints(
         high_confidence_limit = limit // 2
         recommendation_limit = limit - high_confidence_limit
 
-    # Sort each layer internally
-    sorted_high_confidence = sorted(
-        high_confidence_layer, key=lambda kp: -kp["_total_match"]
-    )[:high_confidence_limit]
-    sorted_recommendations = sorted(
-        recommendation_layer, key=lambda kp: -kp["_total_match"]
-    )[:recommendation_limit]
-
-    # MERGE WITH LAYER PRIORITY
-    final_selection = []
+    # Take each layer's best entries (plain tuples with a unique index, so
+    # nsmallest matches sorted(...)[:n] without sorting the whole layer)
+    sorted_high_confidence = heapq.nsmallest(
+        high_confidence_limit, high_confidence_layer
+    )
+    sorted_recommendations = heapq.nsmallest(recommendation_limit, recommendation_layer)
 
     # Layer-specific ranking
-    for i, kp in enumerate(sorted_high_confidence):
-        kp["_layer_rank"] = f"HC-{i + 1}"
-        final_selection.append(kp)
-
-    for i, kp in enumerate(sorted_recommendations):
-        kp["_layer_rank"] = f"RC-{i + 1}"
-        final_selection.append(kp)
+    for prefix, layer in (
+        ("HC", sorted_high_confidence),
+        ("RC", sorted_recommendations),
+    ):
+        for i, (_, _, kp, meta) in enumerate(layer):
+            (
+                kp["_layer"],
+                kp["_base_weight"],
+                kp["_temp_multiplier"],
+                kp["_total_match"],
+                kp["_match_score"],
+                kp["_match_coverage"],
+                kp["_prompt_hits"],
+            ) = meta
+            kp["_layer_rank"] = f"{prefix}-{i + 1}"
 
     # FINAL SORTING: Temperature-aware global ordering
     if temperature <= 0.3:
-        # Conservative: High confidence items first
-        final_selection = sorted(
-            final_selection,
-            key=lambda kp: (
-                0 if kp["_layer"] == "HIGH_CONFIDENCE" else 2,  # HC first
-                1 if kp["_layer"] == "RECOMMENDATION" else 3,  # RC second
-                -kp["_total_match"],  # Then by score
-            ),
-        )
+        # Conservative: High confidence items first, each layer already by score
+        final_entries = sorted_high_confidence + sorted_recommendations
     elif temperature >= 0.7:
         # Exploratory: Recommendations first
-        final_selection = sorted(
-            final_selection,
-            key=lambda kp: (
-                0 if kp["_layer"] == "RECOMMENDATION" else 2,  # RC first
-                1 if kp["_layer"] == "HIGH_CONFIDENCE" else 3,  # HC second
-                -kp["_total_match"],  # Then by score
-            ),
-        )
+        final_entries = sorted_recommendations + sorted_high_confidence
     else:
-        # Balanced: Mix by score but preserve layer identity
-        final_selection = sorted(final_selection, key=lambda kp: -kp["_total_match"])
+        # Balanced: Mix by score but preserve layer identity (HC wins ties)
+        final_entries = sorted(
+            sorted_high_confidence + sorted_recommendations,
+            key=lambda entry: (entry[0], entry[3][0] != "HIGH_CONFIDENCE"),
+        )
 
     # Return only the requested limit
-    return final_selection[:limit]
+    return [entry[2] for entry in final_entries[:limit]]
 
 
 def apply_intelligent_filtering(
@@ -1,9 +1,10 @@
 #!/usr/bin/env python3
-import json
 import sys
-from typing import Any, Dict, Optional
+from typing import Optional
 
 from common import (
+    _call_json_llm,
+    collect_existing_tags,
     format_playbook,
     generate_task_guidance,
     get_anthropic_client,
@@ -11,12 +12,13 @@ from common import (
     infer_tags_from_text,
     is_diagnostic_mode,
     load_playbook,
-    load_template,
     load_transcript,
     normalize_tags,
     save_diagnostic,
     select_relevant_keypoints,
+    serialize_messages,
 )
+from utils.json_utils import dumps as json_dumps, loads as json_loads
 
 # Configuration constants for better maintainability
 MAX_CONVERSATION_MESSAGES = 12  # Number of recent messages to include in context
@@ -28,32 +30,6 @@ GUIDANCE_GENERATION_MAX_TOKENS = 2048  # Max tokens for guidance generation
 MAX_SELECTED_KEYPOINTS = 25  # Maximum key points to select for context
 
 
-def extract_json_from_response(response_text: str) -> Optional[Dict[Any, Any]]:
-    """Extract JSON from LLM response with robust fallback handling.
-
-    Handles responses wrapped in ```json...``` or ```...``` blocks,
-    or plain JSON strings. Returns None if JSON cannot be parsed.
-    """
-    if not response_text.strip():
-        return None
-
-    if "```json" in response_text:
-        start = response_text.find("```json") + 7
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip() if end > start else ""
-    elif "```" in response_text:
-        start = response_text.find("```") + 3
-        end = response_text.find("```", start)
-        json_text = response_text[start:end].strip() if end > start else ""
-    else:
-        json_text = response_text.strip()
-
-    try:
-        return json.loads(json_text)
-    except json.JSONDecodeError:
-        return None
-
-
 def generate_tags_only(
     messages: list,
     prompt_text: str = "",
@@ -77,14 +53,7 @@ def generate_tags_only(
         }
 
     # Get existing tags from playbook key_points
-    existing_tags = []
-    if playbook and "key_points" in playbook:
-        tags_set = set()
-        for kp in playbook["key_points"]:
-            kp_tags = kp.get("tags", [])
-            if isinstance(kp_tags, list):
-                tags_set.update(kp_tags)
-        existing_tags = list(tags_set)
+    existing_tags, existing_tags_json = collect_existing_tags(playbook)
 
     # Infer seed tags from prompt
     prompt_seed_tags = normalize_tags(
@@ -93,93 +62,63 @@ def generate_tags_only(
 
     # Build format params for tag-only prompt
     format_params = {
-        "conversation": json.dumps(
-            messages[-MAX_CONVERSATION_MESSAGES:] if messages else [],
-            indent=2,
-            ensure_ascii=False,
-        ),
+        "conversation": serialize_messages(messages, limit=MAX_CONVERSATION_MESSAGES),
         "prompt": prompt_text,
     }
 
     if existing_tags:
-        existing_tags_context = f"Available tags: {json.dumps(sorted(existing_tags))}"
+        existing_tags_context = f"Available tags: {existing_tags_json}"
         format_params["existing_tags_context"] = existing_tags_context
     else:
         format_params["existing_tags_context"] = "No existing tags available."
 
-    # Load tag-only template (reuse task_guidance template but ignore guidance part)
-    template = load_template("task_guidance.txt")
-    prompt = template.format(**format_params)
-
-    response = client.messages.create(
-        model=model,
+    # Tag-only call (reuses the task_guidance template but ignores the guidance part)
+    parsed = _call_json_llm(
+        client,
+        model,
+        "task_guidance.txt",
+        format_params,
         max_tokens=TAGS_GENERATION_MAX_TOKENS,
-        messages=[{"role": "user", "content": prompt}],
+        diagnostic_name=diagnostic_name,
     )
-
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
-
-    response_text = "".join(response_text_parts)
-
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# TAGS-ONLY PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
-        )
-
-    if not response_text:
+    if not isinstance(parsed, dict):
+        parsed = None
+
+    if parsed:
+        tags_data = parsed.get("tags", {})
+        if isinstance(tags_data, dict) and "final_tags" in tags_data:
+            llm_tags = [
+                t for t in tags_data.get("final_tags", []) if isinstance(t, str)
+            ]
+        else:
+            llm_tags = [t for t in tags_data if isinstance(t, str)]
+    else:
         # Fallback to seed tags
-        final_tags = prompt_seed_tags
+        llm_tags = []
         if is_diagnostic_mode():
             save_diagnostic(
-                f"EMPTY RESPONSE - LLM returned empty response\n\n"
+                f"NO USABLE RESPONSE - LLM response was empty, unparseable or the call failed\n\n"
                 f"Fall back to {len(prompt_seed_tags)} seed tags: {prompt_seed_tags}\n"
                 f"Prompt text preview: {prompt_text[:200]}...",
-                f"{diagnostic_name}_empty_response"
+                f"{diagnostic_name}_json_parse_failed"
             )
-    else:
-        # Parse JSON response using common function
-        parsed = extract_json_from_response(response_text)
-
-        if parsed:
-            tags_data = parsed.get("tags", {})
-            if isinstance(tags_data, dict) and "final_tags" in tags_data:
-                llm_tags = [
-                    t for t in tags_data.get("final_tags", []) if isinstance(t, str)
-                ]
-            else:
-                llm_tags = [t for t in tags_data if isinstance(t, str)]
-        else:
-            # Fallback to seed tags
-            llm_tags = prompt_seed_tags
-            if is_diagnostic_mode():
-                save_diagnostic(
-                    f"JSON PARSE FAILED - Could not parse LLM response\n\n"
-                    f"Response preview: {response_text[:500]}...\n\n"
-                    f"Fall back to {len(prompt_seed_tags)} seed tags: {prompt_seed_tags}",
-                    f"{diagnostic_name}_json_parse_failed"
-                )
 
-        # Combine and normalize tags
-        final_tags = normalize_tags(
-            prompt_seed_tags + llm_tags, max_tags=MAX_TAGS_FINAL
-        )
-        final_tags = final_tags or prompt_seed_tags
+    # Combine and normalize tags
+    final_tags = normalize_tags(
+        prompt_seed_tags + llm_tags, max_tags=MAX_TAGS_FINAL
+    )
+    final_tags = final_tags or prompt_seed_tags
 
-        # Final check: if still no tags, add diagnostic
-        if not final_tags and is_diagnostic_mode():
-            save_diagnostic(
-                f"NO TAGS GENERATED - All fallback strategies failed\n\n"
-                f"Seed tags: {prompt_seed_tags}\n"
-                f"LLM tags: {llm_tags}\n"
-                f"Combined (pre-normalization): {prompt_seed_tags + llm_tags}\n"
-                f"Final (post-normalization): {final_tags}",
-                f"{diagnostic_name}_no_final_tags"
-            )
+    # Final check: if still no tags, add diagnostic
+    if not final_tags and is_diagnostic_mode():
+        save_diagnostic(
+            f"NO TAGS GENERATED - All fallback strategies failed\n\n"
+            f"Seed tags: {prompt_seed_tags}\n"
+            f"LLM tags: {llm_tags}\n"
+            f"Combined (pre-normalization): {prompt_seed_tags + llm_tags}\n"
+            f"Final (post-normalization): {final_tags}",
+            f"{diagnostic_name}_no_final_tags"
+        )
 
     return {
         "tags": {
@@ -239,11 +178,7 @@ def generate_context_aware_guidance(
 
     # Build context-aware guidance prompt
     format_params = {
-        "conversation": json.dumps(
-            messages[-MAX_CONVERSATION_MESSAGES:] if messages else [],
-            indent=2,
-            ensure_ascii=False,
-        ),
+        "conversation": serialize_messages(messages, limit=MAX_CONVERSATION_MESSAGES),
         "prompt": prompt_text,
         "matched_keypoints": kpts_context,
         "tags": ", ".join(tags),
@@ -251,71 +186,42 @@ def generate_context_aware_guidance(
         "existing_tags_context": f"Generated tags: {', '.join(tags)}",
     }
 
-    template = load_template("task_guidance_with_kpts.txt")
-
-    # Use a safer template replacement method that handles JSON braces properly
-    prompt = template
-    for key, value in format_params.items():
-        # Use replace instead of format to avoid JSON brace conflicts
-        placeholder = "{" + key + "}"
-        prompt = prompt.replace(placeholder, str(value))
-
-    response = client.messages.create(
-        model=model,
+    # The template contains literal JSON braces, so placeholders are replaced
+    # directly instead of going through str.format
+    parsed = _call_json_llm(
+        client,
+        model,
+        "task_guidance_with_kpts.txt",
+        format_params,
         max_tokens=GUIDANCE_GENERATION_MAX_TOKENS,
-        messages=[{"role": "user", "content": prompt}],
+        diagnostic_name=diagnostic_name,
+        replace_placeholders=True,
     )
-
-    response_text_parts = []
-    for block in response.content:
-        block_type = getattr(block, "type", None)
-        if block_type == "text":
-            response_text_parts.append(block.text)
-
-    response_text = "".join(response_text_parts)
-
-    if is_diagnostic_mode():
-        save_diagnostic(
-            f"# CONTEXT-AWARE GUIDANCE PROMPT\n{prompt}\n\n{'=' * 80}\n\n# RESPONSE\n{response_text}\n",
-            diagnostic_name,
-        )
-
-    if not response_text:
+    if not isinstance(parsed, dict):
+        parsed = None
+
+    if parsed:
+        guidance_result = parsed.get("task_guidance", {})
+        recommended_kpt_ids = parsed.get("recommended_kpt_ids", [])
+        # Ensure required fields exist
+        if "brief_guidance" not in guidance_result:
+            guidance_result["brief_guidance"] = ""
+        if "complexity" not in guidance_result:
+            guidance_result["complexity"] = "moderate"
+    else:
         if is_diagnostic_mode():
             save_diagnostic(
-                f"EMPTY GUIDANCE RESPONSE - LLM returned empty response\n\n"
-                f"Matched keypoints: {len(matched_keypoints)} items\n"
+                f"NO USABLE GUIDANCE RESPONSE - LLM response was empty, unparseable or the call failed\n\n"
+                f"Matched keypoints: {len(matched_keypoints)}\n"
                 f"Tags: {tags}\n"
                 f"Kpts context length: {len(kpts_context)} chars",
-                f"{diagnostic_name}_empty_response"
+                f"{diagnostic_name}_json_parse_failed"
             )
-        return {"complexity": "moderate", "brief_guidance": ""}
-    else:
-        # Parse JSON response using common function
-        parsed = extract_json_from_response(response_text)
-
-        if parsed:
-            guidance_result = parsed.get("task_guidance", {})
-            recommended_kpt_ids = parsed.get("recommended_kpt_ids", [])
-            # Ensure required fields exist
-            if "brief_guidance" not in guidance_result:
-                guidance_result["brief_guidance"] = ""
-            if "complexity" not in guidance_result:
-                guidance_result["complexity"] = "moderate"
-        else:
-            if is_diagnostic_mode():
-                save_diagnostic(
-                    f"GUIDANCE JSON PARSE FAILED - Could not parse LLM response\n\n"
-                    f"Response preview: {response_text[:500]}...\n\n"
-                    f"Matched keypoints: {len(matched_keypoints)}\n"
-                    f"Tags: {tags}",
-                    f"{diagnostic_name}_json_parse_failed"
-                )
-            guidance_result = {
-                "complexity": "moderate",
-                "brief_guidance": "Failed to parse guidance response",
-            }
-            recommended_kpt_ids = []
+        guidance_result = {
+            "complexity": "moderate",
+            "brief_guidance": "Failed to parse guidance response",
+        }
+        recommended_kpt_ids = []
 
     # Return both guidance result and recommended kpt ids
     return {
@@ -497,7 +403,7 @@ def main():
     handler = get_exception_handler()
 
     try:
-        input_data = json.load(sys.stdin)
+        input_data = json_loads(sys.stdin.buffer.read())
         session_id = input_data.get("session_id", "unknown")
         prompt_text = input_data.get("prompt", "")
         transcript_path = input_data.get("transcript_path")
@@ -565,7 +471,7 @@ def main():
                     f"Formatted context length: {len(context)} characters",
                     "empty_context_analysis"
                 )
-            print(json.dumps({}), flush=True)
+            print(json_dumps({}), flush=True)
             sys.exit(0)
 
         if is_diagnostic_mode():
@@ -587,7 +493,7 @@ def main():
                 },
             }
             save_diagnostic(
-                json.dumps(diagnostic_payload, indent=2, ensure_ascii=False),
+                json_dumps(diagnostic_payload, indent=True),
                 "user_prompt_inject",
             )
 
@@ -599,7 +505,7 @@ def main():
         }
 
         sys.stdout.reconfigure(encoding="utf-8")
-        print(json.dumps(response), flush=True)
+        print(json_dumps(response), flush=True)
 
     except Exception as e:
         # Use global exception handler for consistent error logging and user feedback
@@ -0,0 +1,41 @@
+"""JSON helpers that use orjson when it is installed and fall back to stdlib json."""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+
+def dumps_bytes(obj: Any, indent: bool = False) -> bytes:
+    """Serialize ``obj`` to UTF-8 JSON bytes (2-space indent when requested)."""
+    if ORJSON_AVAILABLE:
+        option = orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False).encode(
+        "utf-8"
+    )
+
+
+def dumps(obj: Any, indent: bool = False) -> str:
+    """Serialize ``obj`` to a JSON string without escaping non-ASCII text."""
+    if ORJSON_AVAILABLE:
+        return dumps_bytes(obj, indent=indent).decode("utf-8")
+    return json.dumps(obj, indent=2 if indent else None, ensure_ascii=False)
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """Parse JSON text or UTF-8 bytes.
+
+    Raises json.JSONDecodeError on invalid input with either backend
+    (orjson.JSONDecodeError subclasses it).
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
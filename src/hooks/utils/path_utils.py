@@ -2,6 +2,7 @@
 """
 Path and directory utilities for Claude hooks.
 """
+import functools
 import os
 from datetime import datetime
 from pathlib import Path
@@ -18,20 +19,39 @@ def get_project_dir() -> Path:
     """Get the project directory from environment or current working directory."""
     project_dir = os.getenv("CLAUDE_PROJECT_DIR")
     if project_dir:
-        return Path(project_dir)
+        return _project_path(project_dir)
     return Path.cwd()
 
 
+@functools.lru_cache(maxsize=4)
+def _project_path(project_dir: str) -> Path:
+    # Keyed on the env value, so a later CLAUDE_PROJECT_DIR change still applies.
+    return Path(project_dir)
+
+
 def get_user_claude_dir() -> Path:
     """Get the user's Claude configuration directory."""
-    home = Path.home()
-    return home / ".claude"
+    return _user_claude_dir(os.getenv("HOME"))
+
+
+@functools.lru_cache(maxsize=4)
+def _user_claude_dir(home_env) -> Path:
+    # Path.home() resolves from $HOME, so that value is the cache key.
+    return Path.home() / ".claude"
 
 
 def is_diagnostic_mode() -> bool:
-    """Check if diagnostic mode is enabled."""
-    flag_file = get_project_dir() / ".claude" / "diagnostic_mode"
-    return flag_file.exists()
+    """Check if diagnostic mode is enabled.
+
+    The flag file is checked once per project dir per process; call
+    ``_diagnostic_flag.cache_clear()`` to pick up a change.
+    """
+    return _diagnostic_flag(get_project_dir())
+
+
+@functools.lru_cache(maxsize=4)
+def _diagnostic_flag(project_dir: Path) -> bool:
+    return (project_dir / ".claude" / "diagnostic_mode").exists()
 
 
 def _diagnostic_dirs() -> list[Path]:
@@ -3,36 +3,12 @@
 import re
 from typing import List, Optional
 
+# Candidate words for inferred tags: start with a letter, at least three characters.
+_WORD_RE = re.compile(r"[a-zA-Z][a-zA-Z0-9_\-]{2,}")
 
-def normalize_tags(tags: Optional[list[str]], max_tags: int = 6) -> list[str]:
-    """Normalize tag list to lowercase unique values with a soft cap."""
-    normalized = []
-    seen = set()
-
-    tag_list = [tags] if isinstance(tags, str) else (tags or [])
-
-    for tag in tag_list:
-        if not isinstance(tag, str):
-            continue
-        clean = tag.strip().lower()
-        # enforce ascii-only tags to keep output in English
-        try:
-            clean.encode("ascii")
-        except UnicodeEncodeError:
-            continue
-        if not clean or clean in seen:
-            continue
-        normalized.append(clean[:64])
-        seen.add(clean)
-        if len(normalized) >= max_tags:
-            break
-
-    return normalized
-
-
-def infer_tags_from_text(text: str, max_tags: int = 5) -> list[str]:
-    """Heuristic tag extraction when no explicit tags are provided."""
-    stopwords = {
+# Common words that never make useful tags.
+_STOPWORDS = frozenset(
+    {
         "the",
         "this",
         "that",
@@ -58,13 +34,43 @@ def infer_tags_from_text(text: str, max_tags: int = 5) -> list[str]:
         "fix",
         "task",
     }
-    words = re.findall(r"[a-zA-Z][a-zA-Z0-9_\-]{2,}", text.lower())
+)
+
+
+def normalize_tags(tags: Optional[list[str]], max_tags: int = 6) -> list[str]:
+    """Normalize tag list to lowercase unique values with a soft cap."""
+    normalized = []
+    seen = set()
+
+    tag_list = [tags] if isinstance(tags, str) else (tags or [])
+
+    for tag in tag_list:
+        if not isinstance(tag, str):
+            continue
+        clean = tag.strip().lower()
+        # enforce ascii-only tags to keep output in English
+        if not clean.isascii():
+            continue
+        if not clean or clean in seen:
+            continue
+        normalized.append(clean[:64])
+        seen.add(clean)
+        if len(normalized) >= max_tags:
+            break
+
+    return normalized
+
+
+def infer_tags_from_text(text: str, max_tags: int = 5) -> list[str]:
+    """Heuristic tag extraction when no explicit tags are provided."""
+    words = _WORD_RE.findall(text.lower())
     tags = []
+    seen = set()
     for word in words:
-        if word in stopwords or word.isdigit():
+        if word in _STOPWORDS or word in seen:
             continue
-        if word not in tags:
-            tags.append(word)
+        tags.append(word)
+        seen.add(word)
         if len(tags) >= max_tags:
             break
     return tags
\ No newline at end of file